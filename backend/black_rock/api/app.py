@@ -3,10 +3,25 @@ Black Rock Payment Terminal - Flask API Application
 """
 
 import os
-import json
+import atexit
+import tempfile
+import time
+import uuid
+import hashlib
 import logging
-from flask import Flask, request, jsonify, session
+import threading
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from cachetools import TTLCache
+from flask import Flask, Request, Response, request, jsonify, session, g, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import BadRequest
 from flask_cors import CORS
+from pydantic import ValidationError
+import requests
+from requests.adapters import HTTPAdapter
 import secrets
 
 from black_rock.models.database import DatabaseManager
@@ -14,69 +29,344 @@ from black_rock.services.auth_service import AuthService
 from black_rock.services.payout_service import PayoutService
 from black_rock.services.notification_service import NotificationService
 from black_rock.services.transaction_processor import TransactionProcessor
-from black_rock.core.transaction import Transaction, TransactionType, PaymentMethod
+from black_rock.core.transaction import Transaction
 from black_rock.handlers.protocol_handler import ProtocolFactory, MTIHandler
+from black_rock.config.settings import PROTOCOLS
+from black_rock.api.schemas import (
+    RegisterRequest, LoginRequest, ProcessTransactionRequest, PayoutRequest,
+    validation_message
+)
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that (de)serializes with orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS),
+            mimetype=self.mimetype
+        )
+
+class JSONRequest(Request):
+    """Request whose JSON body is parsed once, regardless of Content-Type"""
+    
+    def on_json_loading_failed(self, e):
+        raise BadRequest('Invalid JSON body')
+    
+    def json_body(self):
+        """
+        Return the parsed JSON object body
+        
+        Raises:
+            BadRequest: If the body is malformed, not an object, or empty
+        """
+        data = self.get_json(force=True, cache=True)
+        if not data or not isinstance(data, dict):
+            raise BadRequest('No data provided')
+        return data
+
+def json_response(obj, status=200):
+    """Serialize a response body straight to bytes, bypassing jsonify"""
+    return Response(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+                    status=status, mimetype='application/json')
+
+# The health payload never changes, so probes can be answered without Flask
+_HEALTH_BODY = orjson.dumps({
+    'status': 'healthy',
+    'message': 'Payment Terminal API is running'
+})
+_HEALTH_HEADERS = (
+    ('Content-Type', 'application/json'),
+    ('Content-Length', str(len(_HEALTH_BODY))),
+    ('Cache-Control', 'public, max-age=300'),
+    ('Vary', 'Cookie')
+)
+
+class HealthCheckFastPath:
+    """
+    WSGI middleware that answers plain health probes before Flask runs
+    
+    Requests carrying an Origin header still go through Flask so browsers
+    receive the CORS headers.
+    """
+    
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+    
+    def __call__(self, environ, start_response):
+        if (environ.get('PATH_INFO') == '/api/health'
+                and environ.get('REQUEST_METHOD') == 'GET'
+                and 'HTTP_ORIGIN' not in environ):
+            start_response('200 OK', list(_HEALTH_HEADERS))
+            return [_HEALTH_BODY]
+        return self.wsgi_app(environ, start_response)
+
+DEFAULT_SECRET_KEY_FILE = '/etc/black_rock/secret_key'
+
+def _load_secret_key():
+    """
+    Load the session signing key
+    
+    The key comes from SECRET_KEY, or else from a key file (SECRET_KEY_FILE,
+    default /etc/black_rock/secret_key) that is created on first start. Every
+    worker process therefore signs sessions with the same key. In production
+    a missing key is fatal; elsewhere a per-process key is used with a warning.
+    
+    Returns:
+        The secret key
+    """
+    secret_key = os.environ.get('SECRET_KEY')
+    if secret_key:
+        return secret_key
+    
+    key_file = os.environ.get('SECRET_KEY_FILE', DEFAULT_SECRET_KEY_FILE)
+    logger.warning("SECRET_KEY is not set; using key file %s", key_file)
+    try:
+        if not os.path.exists(key_file):
+            # Write to a temporary file and link it into place so concurrent
+            # workers never read a partially written key
+            key_dir = os.path.dirname(key_file) or '.'
+            os.makedirs(key_dir, mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=key_dir)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(secrets.token_bytes(32))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.link(tmp_path, key_file)
+            except FileExistsError:
+                pass
+            finally:
+                os.unlink(tmp_path)
+        with open(key_file, 'rb') as f:
+            return f.read()
+    except OSError:
+        if os.environ.get('FLASK_ENV') == 'production':
+            raise RuntimeError(f"No SECRET_KEY set and key file {key_file} is unavailable")
+        logger.warning("Key file %s is unavailable; sessions will not survive a restart", key_file)
+        return secrets.token_bytes(32)
+
 # Initialize Flask app
 app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(16))
+app.json = OrjsonProvider(app)
+app.request_class = JSONRequest
+app.wsgi_app = HealthCheckFastPath(app.wsgi_app)
+app.secret_key = _load_secret_key()
+
+# Keep sessions server-side when Redis is configured, so the cookie
+# carries only a session id instead of the signed session payload
+redis_url = os.environ.get('REDIS_URL')
+if redis_url:
+    import redis
+    from flask_session import Session
+    
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis.Redis(
+        connection_pool=redis.BlockingConnectionPool.from_url(redis_url, max_connections=50)
+    )
+    Session(app)
 
 # Enable CORS
 CORS(app, supports_credentials=True)
 
+@app.before_request
+def assign_request_id():
+    """Tag each request with an id that links client errors to server logs"""
+    g.request_id = uuid.uuid4().hex
+
+@app.errorhandler(BadRequest)
+def handle_bad_request(error):
+    """Report malformed or missing request bodies as JSON"""
+    return jsonify({
+        'success': False,
+        'message': error.description
+    }), 400
+
+# Responses that do not depend on the caller may be cached by shared caches
+_PUBLIC_ENDPOINTS = frozenset({'health_check', 'get_protocols'})
+
+@app.after_request
+def set_cache_headers(response):
+    """Mark public responses cacheable and keep everything else out of shared caches,
+    unless the handler chose its own Cache-Control"""
+    response.vary.add('Cookie')
+    if request.endpoint in _PUBLIC_ENDPOINTS:
+        response.headers.setdefault('Cache-Control', 'public, max-age=300')
+    else:
+        response.headers.setdefault('Cache-Control', 'private, no-store')
+    return response
+
 # Initialize services
 db_manager = DatabaseManager()
+# Closing the pool runs PRAGMA optimize so the next start plans with fresh statistics
+atexit.register(db_manager.close)
 auth_service = AuthService(db_manager)
 payout_service = PayoutService(db_manager)
 notification_service = NotificationService(db_manager)
 
+# Shared HTTP session so calls to the payment server reuse pooled connections.
+# The transport never retries: the processor has its own backoff for payments
+# and heartbeats must fail fast for offline detection.
+http_session = requests.Session()
+http_adapter = HTTPAdapter(pool_connections=20, pool_maxsize=50, max_retries=0)
+http_session.mount('https://', http_adapter)
+http_session.mount('http://', http_adapter)
+
 # Initialize transaction processor
 # In a real implementation, these would come from environment variables or config
 processor = TransactionProcessor(
     merchant_id="default_merchant",
     terminal_id="default_terminal",
-    server_url=os.environ.get('PAYMENT_SERVER_URL', 'http://localhost:5000')
+    server_url=os.environ.get('PAYMENT_SERVER_URL', 'http://localhost:5000'),
+    http=http_session
 )
 
 # Start notification processing
-notification_service.start_notification_processing()
+if not notification_service.is_alive():
+    notification_service.start_notification_processing()
+
+# MTI notifications run off the request path; transactions are saved before
+# the response, so an acknowledged transaction is always on disk
+background_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='notify')
+# atexit runs handlers in reverse order, so queued notifications finish before
+# the database pool registered above is closed
+atexit.register(background_executor.shutdown, wait=True)
+
+def _notify(transaction_data, notification_data):
+    """Raise the MTI notification for a saved transaction"""
+    try:
+        notification_service.create_mti_notification(
+            transaction_data['mti'],
+            transaction_data['transaction_id'],
+            notification_data
+        )
+    except Exception:
+        logger.exception("Error notifying transaction %s", transaction_data['transaction_id'])
+
+# Protocol definitions are static, so the response body is built once.
+# The settings are read-only mapping proxies, which serialize as plain dicts.
+_PROTOCOLS_JSON = orjson.dumps({'success': True, 'protocols': PROTOCOLS}, default=dict)
+_PROTOCOLS_ETAG = hashlib.md5(_PROTOCOLS_JSON).hexdigest()
+_PROTOCOLS_CACHE_CONTROL = 'public, max-age=3600'
+
+# Terminal status is polled often and changes slowly, so probes are reused briefly
+TERMINAL_STATUS_TTL = 5.0
+_terminal_status_lock = threading.Lock()
+_terminal_status_cache = {'checked_at': 0.0, 'status': None}
+
+def _get_terminal_status():
+    """Return the processor status, probing at most once per TTL"""
+    with _terminal_status_lock:
+        now = time.monotonic()
+        if (_terminal_status_cache['status'] is None
+                or now - _terminal_status_cache['checked_at'] >= TERMINAL_STATUS_TTL):
+            _terminal_status_cache['status'] = processor.get_terminal_status()
+            _terminal_status_cache['checked_at'] = now
+        return _terminal_status_cache['status']
+
+def require_merchant(fn):
+    """Reject unauthenticated requests and expose the merchant as g.merchant_id"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        merchant_id = session.get('merchant_id')
+        if not merchant_id:
+            return jsonify({
+                'success': False,
+                'message': 'Not authenticated'
+            }), 401
+        g.merchant_id = merchant_id
+        return fn(*args, **kwargs)
+    return wrapper
+
+# Transaction history is paginated with a keyset cursor
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 1000
+
+# Merchant and payout details change rarely, so lookups are cached briefly
+_merchant_cache_lock = threading.RLock()
+_merchant_info_cache = TTLCache(maxsize=4096, ttl=60)
+_payout_info_cache = TTLCache(maxsize=4096, ttl=60)
+# Bumped by every invalidation, so a load that raced one is not cached
+_merchant_cache_generation = 0
+
+def _cached_merchant_lookup(cache, merchant_id, loader):
+    """Return a cached lookup for a merchant, loading it on a miss"""
+    with _merchant_cache_lock:
+        value = cache.get(merchant_id)
+        generation = _merchant_cache_generation
+    if value is None:
+        value = loader(merchant_id)
+        if value is not None:
+            with _merchant_cache_lock:
+                if generation == _merchant_cache_generation:
+                    cache[merchant_id] = value
+    return value
+
+def _merchant_etag(merchant_id, record):
+    """Version tag for a merchant record, derived from its last update time"""
+    version = record.get('updated_at') or record.get('created_at')
+    return hashlib.blake2b(f'{merchant_id}:{version}'.encode(), digest_size=8).hexdigest()
+
+def _conditional_merchant_response(merchant_id, record, key):
+    """Return a merchant record, or 304 if the client already holds this version"""
+    etag = _merchant_etag(merchant_id, record)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify({
+            'success': True,
+            key: record
+        })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=30'
+    return response
+
+def _invalidate_merchant_cache(merchant_id):
+    """Drop any cached lookups for a merchant"""
+    global _merchant_cache_generation
+    with _merchant_cache_lock:
+        _merchant_cache_generation += 1
+        _merchant_info_cache.pop(merchant_id, None)
+        _payout_info_cache.pop(merchant_id, None)
+
+# Every merchant write in this process drops the cached copies
+db_manager.add_merchant_listener(_invalidate_merchant_cache)
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'message': 'Payment Terminal API is running'
-    })
+    return Response(_HEALTH_BODY, status=200, mimetype='application/json')
 
 @app.route('/api/register', methods=['POST'])
 def register_merchant():
     """Register a new merchant"""
+    data = request.json_body()
     try:
-        data = request.get_json()
-        
-        if not data:
+        try:
+            body = RegisterRequest.model_validate(data)
+        except ValidationError as e:
             return jsonify({
                 'success': False,
-                'message': 'No data provided'
+                'message': validation_message(e)
             }), 400
         
-        required_fields = ['merchant_name', 'email', 'password']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'message': f'Missing required field: {field}'
-                }), 400
-        
         result = auth_service.register_merchant(
-            merchant_name=data['merchant_name'],
-            email=data['email'],
-            password=data['password']
+            merchant_name=body.merchant_name,
+            email=body.email,
+            password=body.password
         )
         
         if result['success']:
@@ -84,36 +374,30 @@ def register_merchant():
         else:
             return jsonify(result), 400
             
-    except Exception as e:
-        logger.error(f"Error in register_merchant: {str(e)}")
+    except Exception:
+        logger.exception("Error in %s (request %s)", "register_merchant", g.request_id)
         return jsonify({
             'success': False,
-            'message': f'Registration error: {str(e)}'
+            'message': 'Registration error',
+            'request_id': g.request_id
         }), 500
 
 @app.route('/api/login', methods=['POST'])
 def login_merchant():
     """Authenticate a merchant"""
+    data = request.json_body()
     try:
-        data = request.get_json()
-        
-        if not data:
+        try:
+            body = LoginRequest.model_validate(data)
+        except ValidationError as e:
             return jsonify({
                 'success': False,
-                'message': 'No data provided'
+                'message': validation_message(e)
             }), 400
         
-        required_fields = ['email', 'password']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'message': f'Missing required field: {field}'
-                }), 400
-        
         result = auth_service.authenticate_merchant(
-            email=data['email'],
-            password=data['password']
+            email=body.email,
+            password=body.password
         )
         
         if result['success']:
@@ -123,11 +407,12 @@ def login_merchant():
         else:
             return jsonify(result), 401
             
-    except Exception as e:
-        logger.error(f"Error in login_merchant: {str(e)}")
+    except Exception:
+        logger.exception("Error in %s (request %s)", "login_merchant", g.request_id)
         return jsonify({
             'success': False,
-            'message': f'Authentication error: {str(e)}'
+            'message': 'Authentication error',
+            'request_id': g.request_id
         }), 500
 
 @app.route('/api/logout', methods=['POST'])
@@ -139,253 +424,211 @@ def logout_merchant():
             'success': True,
             'message': 'Logged out successfully'
         }), 200
-    except Exception as e:
-        logger.error(f"Error in logout_merchant: {str(e)}")
+    except Exception:
+        logger.exception("Error in %s (request %s)", "logout_merchant", g.request_id)
         return jsonify({
             'success': False,
-            'message': f'Logout error: {str(e)}'
+            'message': 'Logout error',
+            'request_id': g.request_id
         }), 500
 
 @app.route('/api/merchant/info', methods=['GET'])
+@require_merchant
 def get_merchant_info():
     """Get merchant information"""
     try:
-        # Check if merchant is logged in
-        merchant_id = session.get('merchant_id')
-        if not merchant_id:
-            return jsonify({
-                'success': False,
-                'message': 'Not authenticated'
-            }), 401
+        merchant_id = g.merchant_id
         
-        merchant_info = auth_service.get_merchant_info(merchant_id)
+        merchant_info = _cached_merchant_lookup(
+            _merchant_info_cache, merchant_id, auth_service.get_merchant_info
+        )
         
         if merchant_info:
-            return jsonify({
-                'success': True,
-                'merchant': merchant_info
-            }), 200
+            return _conditional_merchant_response(merchant_id, merchant_info, 'merchant')
         else:
             return jsonify({
                 'success': False,
                 'message': 'Merchant not found'
             }), 404
             
-    except Exception as e:
-        logger.error(f"Error in get_merchant_info: {str(e)}")
+    except Exception:
+        logger.exception("Error in %s (request %s)", "get_merchant_info", g.request_id)
         return jsonify({
             'success': False,
-            'message': f'Error retrieving merchant info: {str(e)}'
+            'message': 'Error retrieving merchant info',
+            'request_id': g.request_id
         }), 500
 
 @app.route('/api/merchant/payout', methods=['GET'])
+@require_merchant
 def get_merchant_payout_info():
     """Get merchant payout information"""
     try:
-        # Check if merchant is logged in
-        merchant_id = session.get('merchant_id')
-        if not merchant_id:
-            return jsonify({
-                'success': False,
-                'message': 'Not authenticated'
-            }), 401
+        merchant_id = g.merchant_id
         
-        payout_info = payout_service.get_merchant_payout_info(merchant_id)
+        payout_info = _cached_merchant_lookup(
+            _payout_info_cache, merchant_id, payout_service.get_merchant_payout_info
+        )
         
         if payout_info:
-            return jsonify({
-                'success': True,
-                'payout_info': payout_info
-            }), 200
+            return _conditional_merchant_response(merchant_id, payout_info, 'payout_info')
         else:
             return jsonify({
                 'success': False,
                 'message': 'Merchant not found'
             }), 404
             
-    except Exception as e:
-        logger.error(f"Error in get_merchant_payout_info: {str(e)}")
+    except Exception:
+        logger.exception("Error in %s (request %s)", "get_merchant_payout_info", g.request_id)
         return jsonify({
             'success': False,
-            'message': f'Error retrieving payout info: {str(e)}'
+            'message': 'Error retrieving payout info',
+            'request_id': g.request_id
         }), 500
 
 @app.route('/api/protocols', methods=['GET'])
 def get_protocols():
     """Get all available protocols"""
     try:
-        from black_rock.config.settings import PROTOCOLS
-        return jsonify({
-            'success': True,
-            'protocols': PROTOCOLS
-        }), 200
-    except Exception as e:
-        logger.error(f"Error in get_protocols: {str(e)}")
+        if request.if_none_match.contains(_PROTOCOLS_ETAG):
+            response = Response(status=304)
+        else:
+            response = Response(_PROTOCOLS_JSON, status=200, mimetype='application/json')
+        response.set_etag(_PROTOCOLS_ETAG)
+        response.headers['Cache-Control'] = _PROTOCOLS_CACHE_CONTROL
+        return response
+    except Exception:
+        logger.exception("Error in %s (request %s)", "get_protocols", g.request_id)
         return jsonify({
             'success': False,
-            'message': f'Error retrieving protocols: {str(e)}'
+            'message': 'Error retrieving protocols',
+            'request_id': g.request_id
         }), 500
 
 @app.route('/api/transaction/process', methods=['POST'])
+@require_merchant
 def process_transaction():
     """Process a payment transaction"""
+    data = request.json_body()
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'success': False,
-                'message': 'No data provided'
-            }), 400
-        
-        # Check if merchant is logged in
-        merchant_id = session.get('merchant_id')
-        if not merchant_id:
-            return jsonify({
-                'success': False,
-                'message': 'Not authenticated'
-            }), 401
-        
-        required_fields = ['amount', 'currency', 'transaction_type', 'payment_method', 'protocol']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'message': f'Missing required field: {field}'
-                }), 400
-        
-        # Validate transaction type
-        try:
-            transaction_type = TransactionType(data['transaction_type'])
-        except ValueError:
-            return jsonify({
-                'success': False,
-                'message': f'Invalid transaction type: {data["transaction_type"]}'
-            }), 400
-        
-        # Validate payment method
-        try:
-            payment_method = PaymentMethod(data['payment_method'])
-        except ValueError:
-            return jsonify({
-                'success': False,
-                'message': f'Invalid payment method: {data["payment_method"]}'
-            }), 400
-        
-        # Validate protocol
-        from black_rock.config.settings import PROTOCOLS
-        if data['protocol'] not in PROTOCOLS:
-            return jsonify({
-                'success': False,
-                'message': f'Invalid protocol: {data["protocol"]}'
-            }), 400
+        merchant_id = g.merchant_id
         
-        # Validate amount
         try:
-            amount = float(data['amount'])
-            if amount <= 0:
-                return jsonify({
-                    'success': False,
-                    'message': 'Amount must be positive'
-                }), 400
-        except ValueError:
-            return jsonify({
-                'success': False,
-                'message': 'Invalid amount format'
-            }), 400
-        
-        # Validate currency
-        from black_rock.config.settings import SUPPORTED_CURRENCIES
-        if data['currency'] not in SUPPORTED_CURRENCIES:
+            body = ProcessTransactionRequest.model_validate(data)
+        except ValidationError as e:
             return jsonify({
                 'success': False,
-                'message': f'Unsupported currency: {data["currency"]}'
+                'message': validation_message(e)
             }), 400
         
         # Create transaction
         transaction = Transaction(
-            amount=amount,
-            currency=data['currency'],
-            transaction_type=transaction_type,
-            payment_method=payment_method,
-            protocol=data['protocol'],
+            amount=body.amount,
+            currency=body.currency,
+            transaction_type=body.transaction_type,
+            payment_method=body.payment_method,
+            protocol=body.protocol,
             merchant_id=merchant_id,
             terminal_id=processor.terminal_id,
-            is_online=data.get('is_online', True)
+            is_online=body.is_online
         )
         
         # Set card data if provided
-        if 'card_data' in data:
-            transaction.set_card_data(data['card_data'])
+        if body.card_data is not None:
+            transaction.set_card_data(body.card_data)
         
         # Process transaction
         processed_transaction = processor.process_transaction(transaction)
         
         # Save transaction to database
-        db_manager.save_transaction(processed_transaction.to_dict())
-        
-        # Create MTI notification
-        if processed_transaction.mti:
-            notification_service.create_mti_notification(
-                processed_transaction.mti,
-                processed_transaction.transaction_id,
+        transaction_data = processed_transaction.to_dict()
+        if not db_manager.save_transaction(transaction_data):
+            logger.error("Transaction %s could not be saved (request %s)",
+                         transaction_data['transaction_id'], g.request_id)
+            return jsonify({
+                'success': False,
+                'message': 'Transaction could not be recorded',
+                'request_id': g.request_id
+            }), 500
+        
+        # Create MTI notification in the background
+        if transaction_data['mti']:
+            background_executor.submit(
+                _notify,
+                transaction_data,
                 {
-                    'status': processed_transaction.status.value,
-                    'approval_code': processed_transaction.approval_code,
-                    'response_code': processed_transaction.response_code,
-                    'response_message': processed_transaction.response_message
+                    'status': transaction_data['status'],
+                    'approval_code': transaction_data['approval_code'],
+                    'response_code': transaction_data['response_code'],
+                    'response_message': transaction_data['response_message']
                 }
             )
         
         return jsonify({
             'success': True,
-            'transaction': processed_transaction.to_dict()
+            'transaction': transaction_data
         }), 200
         
-    except Exception as e:
-        logger.error(f"Error in process_transaction: {str(e)}")
+    except Exception:
+        logger.exception("Error in %s (request %s)", "process_transaction", g.request_id)
         return jsonify({
             'success': False,
-            'message': f'Transaction processing error: {str(e)}'
+            'message': 'Transaction processing error',
+            'request_id': g.request_id
         }), 500
 
 @app.route('/api/transaction/history', methods=['GET'])
+@require_merchant
 def get_transaction_history():
     """Get transaction history for the authenticated merchant"""
     try:
-        # Check if merchant is logged in
-        merchant_id = session.get('merchant_id')
-        if not merchant_id:
-            return jsonify({
-                'success': False,
-                'message': 'Not authenticated'
-            }), 401
-        
-        transactions = db_manager.get_merchant_transactions(merchant_id)
-        
-        return jsonify({
-            'success': True,
-            'transactions': transactions
-        }), 200
+        merchant_id = g.merchant_id
         
-    except Exception as e:
-        logger.error(f"Error in get_transaction_history: {str(e)}")
+        limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+        rows = db_manager.iter_merchant_transactions(
+            merchant_id, limit=limit, after_id=request.args.get('cursor')
+        )
+        # Run the query before the response starts, so a database error is still a 500
+        first = next(rows, None)
+        
+        @stream_with_context
+        def generate():
+            # Rows are serialized as SQLite hands them over; the page is never
+            # built as a list, and the pooled connection is released at the end
+            try:
+                yield b'{"success":true,"transactions":['
+                count = 0
+                last_id = None
+                if first is not None:
+                    for transaction in itertools.chain((first,), rows):
+                        if count:
+                            yield b','
+                        yield orjson.dumps(transaction)
+                        count += 1
+                        last_id = transaction['transaction_id']
+                # A full page means there may be more; resume after its last row
+                next_cursor = last_id if count == limit else None
+                yield b'],"next_cursor":' + orjson.dumps(next_cursor) + b'}'
+            finally:
+                rows.close()
+        
+        return Response(generate(), status=200, mimetype='application/json')
+        
+    except Exception:
+        logger.exception("Error in %s (request %s)", "get_transaction_history", g.request_id)
         return jsonify({
             'success': False,
-            'message': f'Error retrieving transaction history: {str(e)}'
+            'message': 'Error retrieving transaction history',
+            'request_id': g.request_id
         }), 500
 
 @app.route('/api/transaction/<transaction_id>', methods=['GET'])
+@require_merchant
 def get_transaction(transaction_id):
     """Get a specific transaction by ID"""
     try:
-        # Check if merchant is logged in
-        merchant_id = session.get('merchant_id')
-        if not merchant_id:
-            return jsonify({
-                'success': False,
-                'message': 'Not authenticated'
-            }), 401
+        merchant_id = g.merchant_id
         
         transaction = db_manager.get_transaction(transaction_id)
         
@@ -407,144 +650,98 @@ def get_transaction(transaction_id):
                 'message': 'Transaction not found'
             }), 404
             
-    except Exception as e:
-        logger.error(f"Error in get_transaction: {str(e)}")
+    except Exception:
+        logger.exception("Error in %s (request %s)", "get_transaction", g.request_id)
         return jsonify({
             'success': False,
-            'message': f'Error retrieving transaction: {str(e)}'
+            'message': 'Error retrieving transaction',
+            'request_id': g.request_id
         }), 500
 
 @app.route('/api/notifications', methods=['GET'])
+@require_merchant
 def get_notifications():
-    """Get pending MTI notifications"""
+    """Get recent MTI notifications for the authenticated merchant"""
     try:
-        # Check if merchant is logged in
-        merchant_id = session.get('merchant_id')
-        if not merchant_id:
-            return jsonify({
-                'success': False,
-                'message': 'Not authenticated'
-            }), 401
-        
-        notifications = notification_service.get_pending_notifications()
+        merchant_id = g.merchant_id
         
-        # Filter notifications for this merchant
-        merchant_notifications = [
-            n for n in notifications 
-            if db_manager.get_transaction(n['transaction_id'])['merchant_id'] == merchant_id
-        ]
+        # The notification worker marks rows processed as soon as they are
+        # created, so list recent notifications rather than the pending queue
+        limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+        notifications = notification_service.get_merchant_notifications(merchant_id, limit)
         
-        return jsonify({
+        return json_response({
             'success': True,
-            'notifications': merchant_notifications
-        }), 200
+            'notifications': notifications
+        })
         
-    except Exception as e:
-        logger.error(f"Error in get_notifications: {str(e)}")
+    except Exception:
+        logger.exception("Error in %s (request %s)", "get_notifications", g.request_id)
         return jsonify({
             'success': False,
-            'message': f'Error retrieving notifications: {str(e)}'
+            'message': 'Error retrieving notifications',
+            'request_id': g.request_id
         }), 500
 
 @app.route('/api/payout/process', methods=['POST'])
+@require_merchant
 def process_payout():
     """Process a payout to merchant's configured accounts"""
+    data = request.json_body()
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'success': False,
-                'message': 'No data provided'
-            }), 400
-        
-        # Check if merchant is logged in
-        merchant_id = session.get('merchant_id')
-        if not merchant_id:
-            return jsonify({
-                'success': False,
-                'message': 'Not authenticated'
-            }), 401
+        merchant_id = g.merchant_id
         
-        required_fields = ['amount', 'currency', 'payout_method']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'message': f'Missing required field: {field}'
-                }), 400
-        
-        # Validate amount
         try:
-            amount = float(data['amount'])
-            if amount <= 0:
-                return jsonify({
-                    'success': False,
-                    'message': 'Amount must be positive'
-                }), 400
-        except ValueError:
-            return jsonify({
-                'success': False,
-                'message': 'Invalid amount format'
-            }), 400
-        
-        # Validate currency
-        from black_rock.config.settings import SUPPORTED_CURRENCIES
-        if data['currency'] not in SUPPORTED_CURRENCIES:
+            body = PayoutRequest.model_validate(data)
+        except ValidationError as e:
             return jsonify({
                 'success': False,
-                'message': f'Unsupported currency: {data["currency"]}'
+                'message': validation_message(e)
             }), 400
         
         # Process payout based on method
-        if data['payout_method'] == 'bank':
+        if body.payout_method == 'bank':
             result = payout_service.process_bank_payout(
-                merchant_id, amount, data['currency'], data.get('transaction_id', 'N/A')
+                merchant_id, body.amount, body.currency, body.transaction_id
             )
-        elif data['payout_method'] == 'crypto':
+        else:
             result = payout_service.process_crypto_payout(
-                merchant_id, amount, data['currency'], data.get('transaction_id', 'N/A')
+                merchant_id, body.amount, body.currency, body.transaction_id
             )
-        else:
-            return jsonify({
-                'success': False,
-                'message': f'Invalid payout method: {data["payout_method"]}'
-            }), 400
         
         return jsonify(result), 200 if result['success'] else 400
         
-    except Exception as e:
-        logger.error(f"Error in process_payout: {str(e)}")
+    except Exception:
+        logger.exception("Error in %s (request %s)", "process_payout", g.request_id)
         return jsonify({
             'success': False,
-            'message': f'Payout processing error: {str(e)}'
+            'message': 'Payout processing error',
+            'request_id': g.request_id
         }), 500
 
 @app.route('/api/terminal/status', methods=['GET'])
+@require_merchant
 def get_terminal_status():
     """Get terminal status"""
     try:
-        # Check if merchant is logged in
-        merchant_id = session.get('merchant_id')
-        if not merchant_id:
-            return jsonify({
-                'success': False,
-                'message': 'Not authenticated'
-            }), 401
-        
-        status = processor.get_terminal_status()
+        status = _get_terminal_status()
         
         return jsonify({
             'success': True,
             'terminal_status': status
         }), 200
         
-    except Exception as e:
-        logger.error(f"Error in get_terminal_status: {str(e)}")
+    except Exception:
+        logger.exception("Error in %s (request %s)", "get_terminal_status", g.request_id)
         return jsonify({
             'success': False,
-            'message': f'Error retrieving terminal status: {str(e)}'
+            'message': 'Error retrieving terminal status',
+            'request_id': g.request_id
         }), 500
 
 if __name__ == '__main__':
+    # Development server only. Handlers block on SQLite and the payment
+    # server, so production runs under threaded Gunicorn workers:
+    #   gunicorn -k gthread -w 4 --threads 8 black_rock.api.app:app
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,123 @@
+"""
+Black Rock Payment Terminal - API Request Schemas
+"""
+
+from typing import Any, Dict, Optional
+from pydantic import BaseModel, ValidationError, field_validator
+from pydantic_core import PydanticCustomError
+
+from black_rock.core.transaction import TransactionType, PaymentMethod
+from black_rock.config.settings import PROTOCOL_NAMES, SUPPORTED_CURRENCIES
+
+# Enum members by value, so validation is a dict lookup rather than a raised ValueError
+_TRANSACTION_TYPES = {t.value: t for t in TransactionType}
+_PAYMENT_METHODS = {m.value: m for m in PaymentMethod}
+
+
+def validation_message(error: ValidationError) -> str:
+    """
+    Build the client-facing message for a failed request validation
+
+    Args:
+        error: The pydantic validation error
+
+    Returns:
+        str: Message for the first missing field, or the first other error
+    """
+    errors = error.errors()
+    for detail in errors:
+        if detail['type'] == 'missing':
+            return f"Missing required field: {detail['loc'][0]}"
+    return errors[0]['msg']
+
+
+class RegisterRequest(BaseModel):
+    """Body of a merchant registration request"""
+    merchant_name: str
+    email: str
+    password: str
+
+
+class LoginRequest(BaseModel):
+    """Body of a merchant login request"""
+    email: str
+    password: str
+
+
+class _AmountRequest(BaseModel):
+    """Shared amount and currency validation for money-moving requests"""
+    amount: float
+    currency: str
+
+    @field_validator('amount', mode='before')
+    @classmethod
+    def _validate_amount(cls, value: Any) -> float:
+        try:
+            amount = float(value)
+        except (TypeError, ValueError):
+            raise PydanticCustomError('amount_format', 'Invalid amount format')
+        if amount <= 0:
+            raise PydanticCustomError('amount_positive', 'Amount must be positive')
+        return amount
+
+    @field_validator('currency', mode='before')
+    @classmethod
+    def _validate_currency(cls, value: Any) -> str:
+        if not isinstance(value, str) or value not in SUPPORTED_CURRENCIES:
+            raise PydanticCustomError(
+                'currency', 'Unsupported currency: {currency}', {'currency': value}
+            )
+        return value
+
+
+class ProcessTransactionRequest(_AmountRequest):
+    """Body of a payment transaction request"""
+    transaction_type: TransactionType
+    payment_method: PaymentMethod
+    protocol: str
+    is_online: bool = True
+    card_data: Optional[Dict[str, Any]] = None
+
+    @field_validator('transaction_type', mode='before')
+    @classmethod
+    def _validate_transaction_type(cls, value: Any) -> TransactionType:
+        transaction_type = _TRANSACTION_TYPES.get(value) if isinstance(value, str) else None
+        if transaction_type is None:
+            raise PydanticCustomError(
+                'transaction_type', 'Invalid transaction type: {value}', {'value': value}
+            )
+        return transaction_type
+
+    @field_validator('payment_method', mode='before')
+    @classmethod
+    def _validate_payment_method(cls, value: Any) -> PaymentMethod:
+        payment_method = _PAYMENT_METHODS.get(value) if isinstance(value, str) else None
+        if payment_method is None:
+            raise PydanticCustomError(
+                'payment_method', 'Invalid payment method: {value}', {'value': value}
+            )
+        return payment_method
+
+    @field_validator('protocol', mode='before')
+    @classmethod
+    def _validate_protocol(cls, value: Any) -> str:
+        if not isinstance(value, str) or value not in PROTOCOL_NAMES:
+            raise PydanticCustomError(
+                'protocol', 'Invalid protocol: {protocol}', {'protocol': value}
+            )
+        return value
+
+
+class PayoutRequest(_AmountRequest):
+    """Body of a payout request"""
+    payout_method: str
+    transaction_id: str = 'N/A'
+
+    @field_validator('payout_method', mode='before')
+    @classmethod
+    def _validate_payout_method(cls, value: Any) -> str:
+        if value not in ('bank', 'crypto'):
+            raise PydanticCustomError(
+                'payout_method', 'Invalid payout method: {method}', {'method': value}
+            )
+        return value
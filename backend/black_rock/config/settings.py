@@ -1,9 +1,15 @@
 """
 Black Rock Payment Terminal - Configuration Settings
+
+Settings are shared read-only across threads and worker processes, so they
+are exposed as immutable views over the raw definitions below.
 """
 
+import sys
+from types import MappingProxyType
+
 # Protocol definitions
-PROTOCOLS = {
+_PROTOCOLS = {
     "POS Terminal -101.1 (4-digit approval)": {
         "approval_length": 4,
         "is_onledger": True
@@ -39,7 +45,7 @@ PROTOCOLS = {
 }
 
 # MTI Types
-MTI_TYPES = {
+_MTI_TYPES = {
     "0100": "Authorization Request",
     "0110": "Authorization Response",
     "0200": "Financial Transaction Request",
@@ -51,19 +57,42 @@ MTI_TYPES = {
 }
 
 # Supported currencies
-SUPPORTED_CURRENCIES = ["USD", "EUR", "GBP", "BTC", "ETH"]
+SUPPORTED_CURRENCIES = frozenset(map(sys.intern, ("USD", "EUR", "GBP", "BTC", "ETH")))
 
 # Terminal settings
-TERMINAL_SETTINGS = {
+_TERMINAL_SETTINGS = {
     "timeout_seconds": 30,
     "offline_transaction_limit": 1000.00,
     "batch_number": "001"
 }
 
+# Password hashing settings: scrypt cost, 2**14 * 8 blocks is 16 MiB and tens
+# of ms per hash. Stored hashes don't record these, so changing them locks out
+# every merchant whose password was hashed with the old values.
+_PASSWORD_HASHING = {
+    "scrypt_n": 2 ** 14,
+    "scrypt_r": 8,
+    "scrypt_p": 1
+}
+
 # Network settings
-NETWORK_SETTINGS = {
+_NETWORK_SETTINGS = {
     "server_url": "http://localhost:5000",
     "heartbeat_interval": 60,
     "retry_attempts": 3,
     "retry_delay": 5
 }
+
+PROTOCOLS = MappingProxyType({
+    sys.intern(name): MappingProxyType(config) for name, config in _PROTOCOLS.items()
+})
+MTI_TYPES = MappingProxyType({
+    sys.intern(mti): sys.intern(description) for mti, description in _MTI_TYPES.items()
+})
+TERMINAL_SETTINGS = MappingProxyType(_TERMINAL_SETTINGS)
+PASSWORD_HASHING = MappingProxyType(_PASSWORD_HASHING)
+NETWORK_SETTINGS = MappingProxyType(_NETWORK_SETTINGS)
+
+# Membership sets for validation; a frozenset check skips the mapping proxy
+PROTOCOL_NAMES = frozenset(PROTOCOLS)
+MTI_CODES = frozenset(MTI_TYPES)
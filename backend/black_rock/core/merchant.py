@@ -0,0 +1,27 @@
+"""
+Black Rock Payment Terminal - Core Merchant Module
+"""
+
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Optional, Sequence
+
+
+@dataclass(slots=True, frozen=True)
+class Merchant:
+    """Merchant profile and payout details, without credentials"""
+    merchant_id: str
+    merchant_name: str
+    email: str
+    bank_account: Optional[str]
+    crypto_wallet: Optional[str]
+    created_at: Optional[str]
+    updated_at: Optional[str]
+
+    @classmethod
+    def from_row(cls, row: Sequence[Any]) -> 'Merchant':
+        """Build a Merchant from a row selected in field order"""
+        return cls(*row)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert merchant to dictionary for the API layer"""
+        return asdict(self)
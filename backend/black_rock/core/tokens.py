@@ -0,0 +1,52 @@
+"""
+Black Rock Payment Terminal - Random Token Generation
+"""
+
+import os
+import threading
+
+# Bytes drawn from the OS CSPRNG per refill; one getrandom call serves many tokens
+_BUFFER_SIZE = 4096
+
+
+class _TokenPool:
+    """Hands out slices of a buffered os.urandom draw"""
+
+    def __init__(self, buffer_size: int = _BUFFER_SIZE):
+        """Initialize an empty pool; the first token triggers a refill"""
+        self._buffer_size = buffer_size
+        self._buf = b''
+        self._off = 0
+        self._lock = threading.Lock()
+
+    def take(self, nbytes: int) -> bytes:
+        """Return nbytes of unused randomness"""
+        with self._lock:
+            if self._off + nbytes > len(self._buf):
+                self._buf = os.urandom(max(self._buffer_size, nbytes))
+                self._off = 0
+            chunk = self._buf[self._off:self._off + nbytes]
+            self._off += nbytes
+        return chunk
+
+    def reset(self) -> None:
+        """Discard buffered bytes so they are never handed out twice"""
+        self._buf = b''
+        self._off = 0
+        self._lock = threading.Lock()
+
+
+_token_pool = _TokenPool()
+# A forked worker would otherwise inherit the parent's buffer and issue the
+# same tokens as its siblings
+os.register_at_fork(after_in_child=_token_pool.reset)
+
+
+def token_bytes(nbytes: int) -> bytes:
+    """Drop-in for secrets.token_bytes backed by the shared token pool"""
+    return _token_pool.take(nbytes)
+
+
+def token_hex(nbytes: int) -> str:
+    """Drop-in for secrets.token_hex backed by the shared token pool"""
+    return _token_pool.take(nbytes).hex()
@@ -2,21 +2,26 @@
 Black Rock Payment Terminal - Core Transaction Module
 """
 
+import os
 import uuid
+import secrets
 import datetime
+import itertools
 import logging
-from enum import Enum
-from typing import Dict, Any, Optional
+import operator
+from enum import StrEnum
+from typing import Dict, Any, Iterator, Optional
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from black_rock.config.settings import (
+    PROTOCOLS, PROTOCOL_NAMES, SUPPORTED_CURRENCIES, TERMINAL_SETTINGS, MTI_CODES
 )
+
 logger = logging.getLogger(__name__)
 
 
-class TransactionType(Enum):
+# str-valued enums hash as their wire values in C, so dict lookups keyed by
+# member skip Enum's Python-level __hash__; serialized values are unchanged
+class TransactionType(StrEnum):
     """Transaction types supported by the terminal"""
     SALE = "SALE"
     REFUND = "REFUND"
@@ -26,7 +31,7 @@ class TransactionType(Enum):
     BALANCE_INQUIRY = "BALANCE_INQUIRY"
 
 
-class TransactionStatus(Enum):
+class TransactionStatus(StrEnum):
     """Possible transaction statuses"""
     INITIALIZED = "INITIALIZED"
     PROCESSING = "PROCESSING"
@@ -39,7 +44,7 @@ class TransactionStatus(Enum):
     PENDING = "PENDING"
 
 
-class PaymentMethod(Enum):
+class PaymentMethod(StrEnum):
     """Payment methods supported by the terminal"""
     CARD_SWIPE = "CARD_SWIPE"
     CARD_DIP = "CARD_DIP"
@@ -47,8 +52,58 @@ class PaymentMethod(Enum):
     MANUAL_ENTRY = "MANUAL_ENTRY"
 
 
+# Enum members by value, so rehydration skips the Enum.__call__ machinery
+_TRANSACTION_TYPES = TransactionType._value2member_map_
+_TRANSACTION_STATUSES = TransactionStatus._value2member_map_
+_PAYMENT_METHODS = PaymentMethod._value2member_map_
+
+
+def _new_trace_counter() -> Iterator[int]:
+    """Start a trace counter at a random position in the six-digit range"""
+    return itertools.count(secrets.randbelow(1000000))
+
+
+def _reseed_trace_counter() -> None:
+    """Give a forked child its own starting point"""
+    global _TRACE_COUNTER
+    _TRACE_COUNTER = _new_trace_counter()
+
+
+# Process-local trace counter; next() on itertools.count is atomic under the GIL.
+# It starts at a random point so restarts and sibling workers, which share a
+# batch number, don't all issue trace numbers from 000001
+_TRACE_COUNTER = _new_trace_counter()
+os.register_at_fork(after_in_child=_reseed_trace_counter)
+
+
+def _dict_field(name: str) -> property:
+    """Property over the private slot _<name> that drops the cached to_dict() result on write"""
+    slot = f"_{name}"
+
+    def set_field(transaction: "Transaction", value: Any) -> None:
+        setattr(transaction, slot, value)
+        transaction._dict_cache = None
+
+    return property(operator.attrgetter(slot), set_field)
+
+
 class Transaction:
     """Base transaction class for all payment transactions"""
+
+    __slots__ = (
+        "transaction_id", "timestamp", "timestamp_iso", "amount", "currency",
+        "transaction_type", "payment_method", "protocol", "merchant_id", "terminal_id", "is_online",
+        "_status", "_approval_code", "_response_code", "_response_message",
+        "card_data", "_mti", "trace_number", "batch_number", "_dict_cache"
+    )
+    
+    # Fields that change while a transaction is processed; assigning any of them,
+    # directly or through a setter, invalidates the cached to_dict() result
+    status = _dict_field("status")
+    approval_code = _dict_field("approval_code")
+    response_code = _dict_field("response_code")
+    response_message = _dict_field("response_message")
+    mti = _dict_field("mti")
     
     def __init__(
         self,
@@ -64,6 +119,7 @@ class Transaction:
         """Initialize a new transaction"""
         self.transaction_id = str(uuid.uuid4())
         self.timestamp = datetime.datetime.now()
+        self.timestamp_iso = self.timestamp.isoformat()
         self.amount = amount
         self.currency = currency
         self.transaction_type = transaction_type
@@ -82,41 +138,36 @@ class Transaction:
         self.batch_number = None
         
         # Validate protocol
-        from black_rock.config.settings import PROTOCOLS
-        if protocol not in PROTOCOLS:
+        if protocol not in PROTOCOL_NAMES:
             raise ValueError(f"Invalid protocol: {protocol}")
         
         # Validate currency
-        from black_rock.config.settings import SUPPORTED_CURRENCIES
         if currency not in SUPPORTED_CURRENCIES:
             raise ValueError(f"Unsupported currency: {currency}")
         
         # Generate trace number (unique within a batch)
         self.trace_number = self._generate_trace_number()
-        from black_rock.config.settings import TERMINAL_SETTINGS
         self.batch_number = TERMINAL_SETTINGS["batch_number"]
         
-        logger.info(f"Transaction {self.transaction_id} initialized: {transaction_type.value} "
-                   f"for {amount} {currency} using {payment_method.value}")
+        logger.info("Transaction %s initialized: %s for %s %s using %s", self.transaction_id,
+                    transaction_type._value_, amount, currency, payment_method._value_)
     
     def _generate_trace_number(self) -> str:
         """Generate a unique trace number for the transaction"""
-        # Simple implementation - in production this would be more sophisticated
-        return str(int(datetime.datetime.now().timestamp() * 1000) % 1000000).zfill(6)
+        return f"{next(_TRACE_COUNTER) % 1000000:06d}"
     
     def set_card_data(self, card_data: Dict[str, Any]) -> None:
         """Set card data for the transaction"""
         # In a real implementation, this would include encryption/tokenization
         self.card_data = card_data
-        logger.info(f"Card data set for transaction {self.transaction_id}")
+        logger.info("Card data set for transaction %s", self.transaction_id)
     
     def set_mti(self, mti: str) -> None:
         """Set the Message Type Indicator for the transaction"""
-        from black_rock.config.settings import MTI_TYPES
-        if mti not in MTI_TYPES:
+        if mti not in MTI_CODES:
             raise ValueError(f"Invalid MTI: {mti}")
         self.mti = mti
-        logger.info(f"MTI set to {mti} for transaction {self.transaction_id}")
+        logger.info("MTI set to %s for transaction %s", mti, self.transaction_id)
     
     def update_status(self, status: TransactionStatus, response_code: str = None, 
                      response_message: str = None) -> None:
@@ -126,11 +177,23 @@ class Transaction:
             self.response_code = response_code
         if response_message:
             self.response_message = response_message
-        logger.info(f"Transaction {self.transaction_id} status updated to {status.value}")
+        logger.info("Transaction %s status updated to %s", self.transaction_id, status._value_)
+    
+    def set_status(self, status: TransactionStatus) -> None:
+        """Update the transaction status, leaving the response fields as they are"""
+        self.status = status
+        logger.info("Transaction %s status updated to %s", self.transaction_id, status._value_)
+    
+    def set_response(self, status: TransactionStatus, response_code: Optional[str],
+                     response_message: Optional[str]) -> None:
+        """Update the transaction status together with the server response"""
+        self.status = status
+        self.response_code = response_code
+        self.response_message = response_message
+        logger.info("Transaction %s status updated to %s", self.transaction_id, status._value_)
     
     def set_approval_code(self, approval_code: str) -> None:
         """Set the approval code for the transaction"""
-        from black_rock.config.settings import PROTOCOLS
         protocol_info = PROTOCOLS[self.protocol]
         expected_length = protocol_info["approval_length"]
         
@@ -138,27 +201,35 @@ class Transaction:
             raise ValueError(f"Invalid approval code length. Expected {expected_length} digits.")
         
         self.approval_code = approval_code
-        self.update_status(TransactionStatus.APPROVED)
-        logger.info(f"Approval code {approval_code} set for transaction {self.transaction_id}")
+        self.set_status(TransactionStatus.APPROVED)
+        logger.info("Approval code %s set for transaction %s", approval_code, self.transaction_id)
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert transaction to dictionary for storage or transmission"""
+        # Built once and reset when a mutable field changes; callers get a copy they may modify
+        if self._dict_cache is None:
+            self._dict_cache = self._build_dict()
+        return self._dict_cache.copy()
+    
+    def _build_dict(self) -> Dict[str, Any]:
+        """Build the dictionary returned by to_dict"""
+        # Enum _value_ is a plain instance attribute; .value goes through a property
         return {
             "transaction_id": self.transaction_id,
-            "timestamp": self.timestamp.isoformat(),
+            "timestamp": self.timestamp_iso,
             "amount": self.amount,
             "currency": self.currency,
-            "transaction_type": self.transaction_type.value,
-            "payment_method": self.payment_method.value,
+            "transaction_type": self.transaction_type._value_,
+            "payment_method": self.payment_method._value_,
             "protocol": self.protocol,
             "merchant_id": self.merchant_id,
             "terminal_id": self.terminal_id,
             "is_online": self.is_online,
-            "status": self.status.value,
-            "approval_code": self.approval_code,
-            "response_code": self.response_code,
-            "response_message": self.response_message,
-            "mti": self.mti,
+            "status": self._status._value_,
+            "approval_code": self._approval_code,
+            "response_code": self._response_code,
+            "response_message": self._response_message,
+            "mti": self._mti,
             "trace_number": self.trace_number,
             "batch_number": self.batch_number
         }
@@ -166,23 +237,25 @@ class Transaction:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Transaction':
         """Create a transaction object from a dictionary"""
-        transaction = cls(
-            amount=data["amount"],
-            currency=data["currency"],
-            transaction_type=TransactionType(data["transaction_type"]),
-            payment_method=PaymentMethod(data["payment_method"]),
-            protocol=data["protocol"],
-            merchant_id=data["merchant_id"],
-            terminal_id=data["terminal_id"],
-            is_online=data["is_online"]
-        )
-        
+        # The record was validated when it was first created, so skip __init__
+        # rather than generate an ID, timestamp and trace number only to overwrite them
+        transaction = cls.__new__(cls)
         transaction.transaction_id = data["transaction_id"]
         transaction.timestamp = datetime.datetime.fromisoformat(data["timestamp"])
-        transaction.status = TransactionStatus(data["status"])
+        transaction.timestamp_iso = transaction.timestamp.isoformat()
+        transaction.amount = data["amount"]
+        transaction.currency = data["currency"]
+        transaction.transaction_type = _TRANSACTION_TYPES[data["transaction_type"]]
+        transaction.payment_method = _PAYMENT_METHODS[data["payment_method"]]
+        transaction.protocol = data["protocol"]
+        transaction.merchant_id = data["merchant_id"]
+        transaction.terminal_id = data["terminal_id"]
+        transaction.is_online = data["is_online"]
+        transaction.status = _TRANSACTION_STATUSES[data["status"]]
         transaction.approval_code = data["approval_code"]
         transaction.response_code = data["response_code"]
         transaction.response_message = data["response_message"]
+        transaction.card_data = {}
         transaction.mti = data["mti"]
         transaction.trace_number = data["trace_number"]
         transaction.batch_number = data["batch_number"]
@@ -4,28 +4,118 @@ Black Rock Payment Terminal - Protocol Handlers
 
 import logging
 import datetime
-import random
+import re
+import secrets
 import string
+from functools import cache, partial
 from typing import Dict, Any, Optional, List, Tuple
 from enum import Enum
 
 from black_rock.core.transaction import Transaction, TransactionStatus, TransactionType
+from black_rock.config.settings import PROTOCOLS, PROTOCOL_NAMES, MTI_TYPES, MTI_CODES
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# Approval code families: 101.x protocols use numeric codes, 201.x alphanumeric
+_FAMILY_OTHER = 0
+_FAMILY_101 = 1
+_FAMILY_201 = 2
+
+# Alphabet for 201.x alphanumeric approval codes, indexed by base-36 digit
+_ALPHANUMERIC = string.digits + string.ascii_uppercase
+
+# Protocol-specific fields added to every prepared transaction
+_PROTOCOL_EXTRA_FIELDS: Dict[str, Dict[str, Any]] = {
+    "POS Terminal -101.1 (4-digit approval)": {
+        "approval_code_format": "numeric",
+        "approval_length": 4,
+        "requires_online": True
+    },
+    "POS Terminal -101.4 (6-digit approval)": {
+        "approval_code_format": "numeric",
+        "approval_length": 6,
+        "requires_online": True
+    },
+    "POS Terminal -101.6 (Pre-authorization)": {
+        "approval_code_format": "numeric",
+        "approval_length": 6,
+        "requires_online": True,
+        "is_preauth": True
+    },
+    "POS Terminal -101.7 (4-digit approval)": {
+        "approval_code_format": "numeric",
+        "approval_length": 4,
+        "requires_online": True
+    },
+    "POS Terminal -101.8 (PIN-LESS transaction)": {
+        "approval_code_format": "numeric",
+        "approval_length": 4,
+        "requires_online": False,
+        "is_pinless": True
+    },
+    "POS Terminal -201.1 (6-digit approval)": {
+        "approval_code_format": "alphanumeric",
+        "approval_length": 6,
+        "requires_online": True
+    },
+    "POS Terminal -201.3 (6-digit approval)": {
+        "approval_code_format": "alphanumeric",
+        "approval_length": 6,
+        "requires_online": False
+    },
+    "POS Terminal -201.5 (6-digit approval)": {
+        "approval_code_format": "alphanumeric",
+        "approval_length": 6,
+        "requires_online": False
+    }
+}
+
+# Request MTI -> response MTI
+_RESPONSE_MTI: Dict[str, str] = {
+    "0100": "0110",  # Authorization Request -> Authorization Response
+    "0200": "0210",  # Financial Transaction Request -> Financial Transaction Response
+    "0220": "0230",  # Financial Transaction Advice -> Financial Transaction Advice Response
+    "0500": "0510",  # Reversal Request -> Reversal Response
+}
+
+# Transaction type -> request MTI
+_TRANSACTION_TYPE_MTI: Dict[TransactionType, str] = {
+    TransactionType.SALE: "0200",
+    TransactionType.REFUND: "0200",
+    TransactionType.VOID: "0200",
+    TransactionType.PRE_AUTH: "0100",
+    TransactionType.PRE_AUTH_COMPLETION: "0220",
+    TransactionType.BALANCE_INQUIRY: "0100"
+}
+
+# Transaction type -> response MTI
+_TRANSACTION_TYPE_RESPONSE_MTI: Dict[TransactionType, str] = {
+    transaction_type: _RESPONSE_MTI.get(mti, mti)
+    for transaction_type, mti in _TRANSACTION_TYPE_MTI.items()
+}
+
+
+def _numeric_code(length: int) -> str:
+    """Draw a zero-padded numeric code from one CSPRNG call"""
+    return f"{secrets.randbelow(10 ** length):0{length}d}"
+
+
+def _alphanumeric_code(length: int) -> str:
+    """Draw an uppercase alphanumeric code from one CSPRNG call"""
+    value = secrets.randbelow(36 ** length)
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 36)
+        chars.append(_ALPHANUMERIC[digit])
+    return ''.join(chars)
+
 
 class ProtocolHandler:
     """Base class for protocol handlers"""
     
     def __init__(self, protocol_name: str):
         """Initialize the protocol handler"""
-        from black_rock.config.settings import PROTOCOLS
-        if protocol_name not in PROTOCOLS:
+        if protocol_name not in PROTOCOL_NAMES:
             raise ValueError(f"Invalid protocol: {protocol_name}")
         
         self.protocol_name = protocol_name
@@ -33,7 +123,54 @@ class ProtocolHandler:
         self.approval_length = self.protocol_config["approval_length"]
         self.is_onledger = self.protocol_config["is_onledger"]
         
-        logger.info(f"Initialized protocol handler for {protocol_name}")
+        # Payload template with every key in wire order; per-transaction fields are
+        # filled into a copy, so no keys are inserted and the dict never resizes
+        self._payload_template = dict.fromkeys((
+            "protocol", "mti", "transaction_id", "timestamp", "amount", "currency",
+            "merchant_id", "terminal_id", "trace_number", "batch_number"
+        ))
+        self._payload_template["protocol"] = protocol_name
+        self._payload_template.update(_PROTOCOL_EXTRA_FIELDS.get(protocol_name, {}))
+        
+        # Classify the protocol once instead of matching its name on every call
+        if protocol_name.startswith("POS Terminal -101"):
+            self._family = _FAMILY_101
+        elif protocol_name.startswith("POS Terminal -201"):
+            self._family = _FAMILY_201
+        else:
+            self._family = _FAMILY_OTHER
+        # Pick the code generators up front so generate_approval_code doesn't branch
+        self._online_code = partial(
+            _alphanumeric_code if self._family == _FAMILY_201 else _numeric_code,
+            self.approval_length
+        )
+        self._offline_code = partial(_numeric_code, self.approval_length - 2)
+
+        # Compile the whole approval code format check into one pattern
+        length = self.approval_length
+        if not self.is_onledger:
+            # Offline codes are "OF" followed by digits
+            self._approval_re = re.compile(r"OF\d{%d}" % (length - 2))
+            self._approval_format_warning = (
+                "Invalid offline approval code format: should be 'OF' followed by digits"
+            )
+        elif self._family == _FAMILY_101:
+            # 101.x protocols use numeric approval codes
+            self._approval_re = re.compile(r"\d{%d}" % length)
+            self._approval_format_warning = (
+                "Invalid online approval code format for 101.x protocol: should be all digits"
+            )
+        elif self._family == _FAMILY_201:
+            # 201.x protocols use alphanumeric approval codes
+            self._approval_re = re.compile(r"[^\W_]{%d}" % length)
+            self._approval_format_warning = (
+                "Invalid online approval code format for 201.x protocol: should be alphanumeric"
+            )
+        else:
+            self._approval_re = re.compile(r".{%d}" % length, re.DOTALL)
+            self._approval_format_warning = "Invalid approval code format"
+        
+        logger.info("Initialized protocol handler for %s", protocol_name)
     
     def validate_approval_code(self, approval_code: str) -> bool:
         """
@@ -45,35 +182,14 @@ class ProtocolHandler:
         Returns:
             bool: True if valid, False otherwise
         """
-        # Check length
-        if len(approval_code) != self.approval_length:
-            logger.warning(f"Invalid approval code length: expected {self.approval_length}, got {len(approval_code)}")
-            return False
-        
-        # For offline codes, they should start with "OF"
-        if approval_code.startswith("OF") and not self.is_onledger:
-            # Rest should be digits
-            if not approval_code[2:].isdigit():
-                logger.warning("Invalid offline approval code format: should be 'OF' followed by digits")
-                return False
+        if self._approval_re.fullmatch(approval_code):
             return True
         
-        # For online codes, they should be all digits or alphanumeric depending on protocol
-        if self.is_onledger:
-            if self.protocol_name.startswith("POS Terminal -101"):
-                # 101.x protocols use numeric approval codes
-                if not approval_code.isdigit():
-                    logger.warning("Invalid online approval code format for 101.x protocol: should be all digits")
-                    return False
-            elif self.protocol_name.startswith("POS Terminal -201"):
-                # 201.x protocols use alphanumeric approval codes
-                if not all(c.isalnum() for c in approval_code):
-                    logger.warning("Invalid online approval code format for 201.x protocol: should be alphanumeric")
-                    return False
-            
-            return True
-        
-        logger.warning("Invalid approval code format")
+        if len(approval_code) != self.approval_length:
+            logger.warning("Invalid approval code length: expected %s, got %s",
+                           self.approval_length, len(approval_code))
+        else:
+            logger.warning(self._approval_format_warning)
         return False
     
     def generate_approval_code(self, is_offline: bool = False) -> str:
@@ -88,19 +204,10 @@ class ProtocolHandler:
         """
         if is_offline and not self.is_onledger:
             # Generate offline approval code
-            digits = ''.join(random.choices(string.digits, k=self.approval_length - 2))
-            return f"OF{digits}"
+            return f"OF{self._offline_code()}"
         
-        # Generate online approval code
-        if self.protocol_name.startswith("POS Terminal -101"):
-            # 101.x protocols use numeric approval codes
-            return ''.join(random.choices(string.digits, k=self.approval_length))
-        elif self.protocol_name.startswith("POS Terminal -201"):
-            # 201.x protocols use alphanumeric approval codes
-            return ''.join(random.choices(string.ascii_uppercase + string.digits, k=self.approval_length))
-        
-        # Default to numeric
-        return ''.join(random.choices(string.digits, k=self.approval_length))
+        # Generate online approval code: alphanumeric for 201.x, numeric otherwise
+        return self._online_code()
     
     def prepare_transaction_data(self, transaction: Transaction) -> Dict[str, Any]:
         """
@@ -112,62 +219,16 @@ class ProtocolHandler:
         Returns:
             Dict[str, Any]: The prepared transaction data
         """
-        # Base transaction data
-        data = {
-            "protocol": self.protocol_name,
-            "mti": transaction.mti,
-            "transaction_id": transaction.transaction_id,
-            "timestamp": transaction.timestamp.isoformat(),
-            "amount": transaction.amount,
-            "currency": transaction.currency,
-            "merchant_id": transaction.merchant_id,
-            "terminal_id": transaction.terminal_id,
-            "trace_number": transaction.trace_number,
-            "batch_number": transaction.batch_number
-        }
-        
-        # Add protocol-specific fields
-        if self.protocol_name == "POS Terminal -101.1 (4-digit approval)":
-            data["approval_code_format"] = "numeric"
-            data["approval_length"] = 4
-            data["requires_online"] = True
-            
-        elif self.protocol_name == "POS Terminal -101.4 (6-digit approval)":
-            data["approval_code_format"] = "numeric"
-            data["approval_length"] = 6
-            data["requires_online"] = True
-            
-        elif self.protocol_name == "POS Terminal -101.6 (Pre-authorization)":
-            data["approval_code_format"] = "numeric"
-            data["approval_length"] = 6
-            data["requires_online"] = True
-            data["is_preauth"] = True
-            
-        elif self.protocol_name == "POS Terminal -101.7 (4-digit approval)":
-            data["approval_code_format"] = "numeric"
-            data["approval_length"] = 4
-            data["requires_online"] = True
-            
-        elif self.protocol_name == "POS Terminal -101.8 (PIN-LESS transaction)":
-            data["approval_code_format"] = "numeric"
-            data["approval_length"] = 4
-            data["requires_online"] = False
-            data["is_pinless"] = True
-            
-        elif self.protocol_name == "POS Terminal -201.1 (6-digit approval)":
-            data["approval_code_format"] = "alphanumeric"
-            data["approval_length"] = 6
-            data["requires_online"] = True
-            
-        elif self.protocol_name == "POS Terminal -201.3 (6-digit approval)":
-            data["approval_code_format"] = "alphanumeric"
-            data["approval_length"] = 6
-            data["requires_online"] = False
-            
-        elif self.protocol_name == "POS Terminal -201.5 (6-digit approval)":
-            data["approval_code_format"] = "alphanumeric"
-            data["approval_length"] = 6
-            data["requires_online"] = False
+        data = self._payload_template.copy()
+        data["mti"] = transaction.mti
+        data["transaction_id"] = transaction.transaction_id
+        data["timestamp"] = transaction.timestamp_iso
+        data["amount"] = transaction.amount
+        data["currency"] = transaction.currency
+        data["merchant_id"] = transaction.merchant_id
+        data["terminal_id"] = transaction.terminal_id
+        data["trace_number"] = transaction.trace_number
+        data["batch_number"] = transaction.batch_number
         
         return data
     
@@ -180,9 +241,10 @@ class ProtocolHandler:
             transaction: The transaction to update
         """
         # Check if the response is valid for this protocol
-        if "protocol" in response_data and response_data["protocol"] != self.protocol_name:
-            logger.warning(f"Protocol mismatch: expected {self.protocol_name}, got {response_data['protocol']}")
-            transaction.update_status(
+        response_protocol = response_data.get("protocol")
+        if response_protocol is not None and response_protocol != self.protocol_name:
+            logger.warning("Protocol mismatch: expected %s, got %s", self.protocol_name, response_protocol)
+            transaction.set_response(
                 TransactionStatus.ERROR,
                 response_code="E3001",
                 response_message="Protocol mismatch in response"
@@ -190,27 +252,27 @@ class ProtocolHandler:
             return
         
         # Check if the transaction was approved
-        if "approved" in response_data and response_data["approved"]:
+        if response_data.get("approved"):
             # Check if approval code is present and valid
-            if "approval_code" in response_data:
-                approval_code = response_data["approval_code"]
+            approval_code = response_data.get("approval_code")
+            if approval_code is not None:
                 if self.validate_approval_code(approval_code):
                     transaction.set_approval_code(approval_code)
                 else:
-                    transaction.update_status(
+                    transaction.set_response(
                         TransactionStatus.ERROR,
                         response_code="E3002",
                         response_message="Invalid approval code in response"
                     )
             else:
-                transaction.update_status(
+                transaction.set_response(
                     TransactionStatus.ERROR,
                     response_code="E3003",
                     response_message="Missing approval code in approved response"
                 )
         else:
             # Transaction was declined
-            transaction.update_status(
+            transaction.set_response(
                 TransactionStatus.DECLINED,
                 response_code=response_data.get("response_code", "D0001"),
                 response_message=response_data.get("response_message", "Transaction declined")
@@ -221,18 +283,21 @@ class ProtocolFactory:
     """Factory for creating protocol handlers"""
     
     @staticmethod
+    @cache
     def create_handler(protocol_name: str) -> ProtocolHandler:
         """
         Create a protocol handler for the specified protocol
         
+        Handlers hold no per-transaction state, so one instance per protocol
+        is built and shared for the life of the process.
+        
         Args:
             protocol_name: The name of the protocol
             
         Returns:
             ProtocolHandler: The protocol handler
         """
-        from black_rock.config.settings import PROTOCOLS
-        if protocol_name not in PROTOCOLS:
+        if protocol_name not in PROTOCOL_NAMES:
             raise ValueError(f"Invalid protocol: {protocol_name}")
         
         # For now, we use the base ProtocolHandler for all protocols
@@ -254,8 +319,7 @@ class MTIHandler:
         Returns:
             bool: True if valid, False otherwise
         """
-        from black_rock.config.settings import MTI_TYPES
-        return mti in MTI_TYPES
+        return mti in MTI_CODES
     
     @staticmethod
     def get_mti_description(mti: str) -> str:
@@ -268,10 +332,7 @@ class MTIHandler:
         Returns:
             str: The MTI description
         """
-        from black_rock.config.settings import MTI_TYPES
-        if mti in MTI_TYPES:
-            return MTI_TYPES[mti]
-        return "Unknown MTI"
+        return MTI_TYPES.get(mti, "Unknown MTI")
     
     @staticmethod
     def get_response_mti(request_mti: str) -> str:
@@ -284,18 +345,8 @@ class MTIHandler:
         Returns:
             str: The response MTI
         """
-        mti_map = {
-            "0100": "0110",  # Authorization Request -> Authorization Response
-            "0200": "0210",  # Financial Transaction Request -> Financial Transaction Response
-            "0220": "0230",  # Financial Transaction Advice -> Financial Transaction Advice Response
-            "0500": "0510",  # Reversal Request -> Reversal Response
-        }
-        
-        if request_mti in mti_map:
-            return mti_map[request_mti]
-        
         # Default to same MTI if no mapping found
-        return request_mti
+        return _RESPONSE_MTI.get(request_mti, request_mti)
     
     @staticmethod
     def get_mti_for_transaction_type(transaction_type: TransactionType, is_response: bool = False) -> str:
@@ -309,20 +360,7 @@ class MTIHandler:
         Returns:
             str: The MTI
         """
-        mti_map = {
-            TransactionType.SALE: "0200",
-            TransactionType.REFUND: "0200",
-            TransactionType.VOID: "0200",
-            TransactionType.PRE_AUTH: "0100",
-            TransactionType.PRE_AUTH_COMPLETION: "0220",
-            TransactionType.BALANCE_INQUIRY: "0100"
-        }
-        
-        if transaction_type in mti_map:
-            mti = mti_map[transaction_type]
-            if is_response:
-                return MTIHandler.get_response_mti(mti)
-            return mti
-        
         # Default to financial transaction request
-        return "0200" if not is_response else "0210"
+        if is_response:
+            return _TRANSACTION_TYPE_RESPONSE_MTI.get(transaction_type, "0210")
+        return _TRANSACTION_TYPE_MTI.get(transaction_type, "0200")
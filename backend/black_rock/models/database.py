@@ -4,42 +4,267 @@ Black Rock Payment Terminal - Database Models
 
 import sqlite3
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import queue
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple, Union, Callable
+
+from black_rock.core.merchant import Merchant
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Per-connection settings: NORMAL sync is durable under WAL except on power loss,
+# and a 20 MB page cache plus mmap keeps hot pages out of read() syscalls
+_CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-20000',
+    'PRAGMA mmap_size=268435456',
+)
+
+# Room for every statement below plus the variable-shape queries
+_STATEMENT_CACHE_SIZE = 256
+
+# Column lists for full-row reads; explicit so the row shape doesn't follow table changes
+_MERCHANT_COLUMNS = (
+    'merchant_id, merchant_name, email, password_hash, bank_account, crypto_wallet, '
+    'created_at, updated_at'
+)
+# Merchant fields in Merchant's field order; the credential stays in the database
+_MERCHANT_RECORD_COLUMNS = (
+    'merchant_id, merchant_name, email, bank_account, crypto_wallet, created_at, updated_at'
+)
+_TRANSACTION_COLUMNS = (
+    'transaction_id, timestamp, amount, currency, transaction_type, payment_method, '
+    'protocol, merchant_id, terminal_id, is_online, status, approval_code, '
+    'response_code, response_message, mti, trace_number, batch_number'
+)
+_MTI_NOTIFICATION_COLUMNS = 'id, mti, transaction_id, message, timestamp, processed'
+
+# Statements reused on every call, kept compiled in each connection's statement cache
+_SQL_INSERT_MERCHANT = '''
+    INSERT INTO merchants
+    (merchant_id, merchant_name, email, password_hash, bank_account, crypto_wallet)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+_SQL_GET_MERCHANT = f'SELECT {_MERCHANT_COLUMNS} FROM merchants WHERE merchant_id = ?'
+_SQL_GET_MERCHANT_RECORD = f'SELECT {_MERCHANT_RECORD_COLUMNS} FROM merchants WHERE merchant_id = ?'
+_SQL_GET_MERCHANT_BY_EMAIL = f'SELECT {_MERCHANT_COLUMNS} FROM merchants WHERE email = ?'
+_SQL_GET_MERCHANT_AUTH = 'SELECT merchant_id, merchant_name, password_hash FROM merchants WHERE email = ?'
+_SQL_UPDATE_MERCHANT_PAYOUT = '''
+    UPDATE merchants
+    SET bank_account = COALESCE(?, bank_account),
+        crypto_wallet = COALESCE(?, crypto_wallet),
+        updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+    WHERE merchant_id = ?
+'''
+# Only replaces the hash that was verified, so a concurrent password change wins
+_SQL_UPDATE_MERCHANT_PASSWORD_HASH = (
+    'UPDATE merchants SET password_hash = ? WHERE merchant_id = ? AND password_hash = ?'
+)
+_SQL_INSERT_TRANSACTION = '''
+    INSERT INTO transactions
+    (transaction_id, timestamp, amount, currency, transaction_type, payment_method,
+     protocol, merchant_id, terminal_id, is_online, status, approval_code,
+     response_code, response_message, mti, trace_number, batch_number)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_SQL_UPDATE_TRANSACTION = '''
+    UPDATE transactions
+    SET status = ?, approval_code = COALESCE(?, approval_code), response_code = ?, response_message = ?
+    WHERE transaction_id = ?
+'''
+_SQL_GET_TRANSACTION = f'SELECT {_TRANSACTION_COLUMNS} FROM transactions WHERE transaction_id = ?'
+_SQL_GET_TRANSACTION_STATUS = 'SELECT status, approval_code FROM transactions WHERE transaction_id = ?'
+# The message may be bound as UTF-8 bytes; CAST stores it as TEXT without a
+# Python-side decode (a str binds unchanged). The timestamp is local time in
+# ISO format, as datetime.now().isoformat() gave when it was set in Python
+_SQL_INSERT_MTI_NOTIFICATION = '''
+    INSERT INTO mti_notifications
+    (mti, transaction_id, message, timestamp)
+    VALUES (?, ?, CAST(? AS TEXT), strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'))
+    RETURNING id
+'''
+_SQL_GET_PENDING_MTI_NOTIFICATIONS = (
+    f'SELECT {_MTI_NOTIFICATION_COLUMNS} FROM mti_notifications WHERE processed = 0 ORDER BY timestamp ASC'
+)
+# Claims every pending notification in one statement, so two workers polling
+# the same database never deliver the same notification twice
+_SQL_CLAIM_PENDING_MTI_NOTIFICATIONS = (
+    f'UPDATE mti_notifications SET processed = 1 WHERE processed = 0 RETURNING {_MTI_NOTIFICATION_COLUMNS}'
+)
+# Newest notifications for one merchant, delivered or not; walks the merchant's
+# transactions through idx_transactions_merchant_time so LIMIT stops the scan early
+_SQL_GET_MERCHANT_MTI_NOTIFICATIONS = '''
+    SELECT n.id, n.mti, n.transaction_id, n.message, n.timestamp, n.processed
+    FROM transactions t
+    JOIN mti_notifications n ON n.transaction_id = t.transaction_id
+    WHERE t.merchant_id = ?
+    ORDER BY t.timestamp DESC, t.transaction_id DESC, n.id DESC
+    LIMIT ?
+'''
+
+
+class _ConnectionPool:
+    """
+    Bounded pools of long-lived SQLite connections shared across threads
+    
+    Reads and writes use separate connections: readers return sqlite3.Row and
+    run with query_only, writers return plain tuples and are few, since SQLite
+    admits one writer at a time even under WAL.
+    """
+    
+    def __init__(self, db_path: str, size: int, write_size: int = 1):
+        """Open the pooled connections"""
+        self.db_path = db_path
+        self._readers = queue.Queue(maxsize=size)
+        # Every connection to ":memory:" is a separate database, so a single
+        # connection has to serve both roles
+        if db_path == ":memory:":
+            self._writers = self._readers
+            self._readers.put(self._connect(readonly=False, row_factory=sqlite3.Row))
+            return
+        self._writers = queue.Queue(maxsize=write_size)
+        for _ in range(size):
+            self._readers.put(self._connect(readonly=True, row_factory=sqlite3.Row))
+        for _ in range(write_size):
+            self._writers.put(self._connect(readonly=False))
+    
+    def _connect(self, readonly: bool, row_factory=None) -> sqlite3.Connection:
+        """Open a connection that may be handed between worker threads"""
+        # Autocommit mode: the module issues no implicit BEGINs, writers open
+        # their own transaction in connection(write=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None,
+                               cached_statements=_STATEMENT_CACHE_SIZE)
+        conn.row_factory = row_factory
+        self._configure(conn)
+        if readonly:
+            conn.execute('PRAGMA query_only=ON')
+        return conn
+    
+    def _configure(self, conn: sqlite3.Connection) -> None:
+        """Apply the pragmas every pooled connection runs with"""
+        # WAL lets readers proceed while a writer commits; it needs a file on disk
+        if self.db_path != ":memory:":
+            conn.execute('PRAGMA journal_mode=WAL')
+        for pragma in _CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+    
+    @contextmanager
+    def connection(self, write: bool = False):
+        """
+        Borrow a connection for the duration of a with-block
+        
+        Reads run in autocommit mode. Writes run in a BEGIN IMMEDIATE transaction,
+        so the write lock is taken up front (waiting out the busy timeout) instead
+        of failing on a lock upgrade part-way through, and are committed on success
+        or rolled back on error.
+        """
+        connections = self._writers if write else self._readers
+        conn = connections.get()
+        try:
+            if not write:
+                yield conn
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except BaseException:
+                # SQLite may already have rolled back on its own (e.g. disk full)
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+        finally:
+            connections.put(conn)
+    
+    def close(self) -> None:
+        """Close every connection currently in the pools, refreshing planner statistics first"""
+        pools = [self._readers] if self._writers is self._readers else [self._readers, self._writers]
+        for connections in pools:
+            while True:
+                try:
+                    conn = connections.get_nowait()
+                except queue.Empty:
+                    break
+                # PRAGMA optimize only analyzes tables this connection queried,
+                # and may write sqlite_stat1, so readers drop query_only for it
+                try:
+                    conn.execute('PRAGMA query_only=OFF')
+                    conn.execute('PRAGMA optimize')
+                except sqlite3.Error as e:
+                    logger.warning("PRAGMA optimize failed on close: %s", e)
+                conn.close()
+
+
 class DatabaseManager:
     """Manages SQLite database operations for the payment terminal"""
     
-    def __init__(self, db_path: str = "payment_terminal.db"):
+    def __init__(self, db_path: str = "payment_terminal.db", pool_size: int = 5):
         """Initialize database manager"""
         self.db_path = db_path
+        self._pool = _ConnectionPool(db_path, pool_size)
+        self._merchant_listeners: List[Callable[[str], None]] = []
         self.init_database()
     
+    def _conn(self, write: bool = False):
+        """Borrow a pooled connection for the duration of a with-block"""
+        return self._pool.connection(write)
+    
+    def close(self) -> None:
+        """Close the pooled connections; call once no more queries will be made"""
+        self._pool.close()
+    
+    def add_merchant_listener(self, listener: Callable[[str], None]) -> None:
+        """Call listener(merchant_id) after every committed write to a merchant row"""
+        self._merchant_listeners.append(listener)
+    
+    def _merchant_changed(self, merchant_id: str) -> None:
+        """Notify merchant listeners, typically caches that must drop the old row"""
+        for listener in self._merchant_listeners:
+            try:
+                listener(merchant_id)
+            except Exception as e:
+                logger.error(f"Merchant listener failed: {str(e)}")
+    
     def init_database(self) -> None:
         """Initialize the database with required tables"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
+            with self._conn(write=True) as conn:
                 # Create merchants table
-                cursor.execute('''
+                conn.execute('''
                     CREATE TABLE IF NOT EXISTS merchants (
                         merchant_id TEXT PRIMARY KEY,
                         merchant_name TEXT NOT NULL,
                         email TEXT UNIQUE NOT NULL,
-                        password_hash TEXT NOT NULL,
+                        password_hash BLOB NOT NULL,
                         bank_account TEXT,
                         crypto_wallet TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                     )
                 ''')
                 
+                # Databases created before updated_at existed get the column without
+                # a default, since SQLite cannot add one with CURRENT_TIMESTAMP
+                # (column 1 of table_info is the name; writers return plain tuples)
+                merchant_columns = {row[1] for row in conn.execute('PRAGMA table_info(merchants)')}
+                if 'updated_at' not in merchant_columns:
+                    conn.execute('ALTER TABLE merchants ADD COLUMN updated_at TIMESTAMP')
+                
+                # Password hashes are stored as a salt + digest BLOB; rewrite scrypt
+                # hashes saved in the earlier "scrypt$<hex>:<salt hex>" text form.
+                # Legacy SHA-256 text hashes cannot be converted and stay as they are
+                scrypt_text_rows = conn.execute(
+                    "SELECT merchant_id, password_hash FROM merchants "
+                    "WHERE typeof(password_hash) = 'text' AND password_hash LIKE 'scrypt$%'"
+                ).fetchall()
+                for merchant_id, stored in scrypt_text_rows:
+                    digest_hex, _, salt_hex = stored[len('scrypt$'):].rpartition(':')
+                    conn.execute('UPDATE merchants SET password_hash = ? WHERE merchant_id = ?',
+                                 (bytes.fromhex(salt_hex) + bytes.fromhex(digest_hex), merchant_id))
+                
                 # Create transactions table
-                cursor.execute('''
+                conn.execute('''
                     CREATE TABLE IF NOT EXISTS transactions (
                         transaction_id TEXT PRIMARY KEY,
                         timestamp TEXT NOT NULL,
@@ -63,7 +288,7 @@ class DatabaseManager:
                 ''')
                 
                 # Create MTI notifications table
-                cursor.execute('''
+                conn.execute('''
                     CREATE TABLE IF NOT EXISTS mti_notifications (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         mti TEXT NOT NULL,
@@ -75,61 +300,91 @@ class DatabaseManager:
                     )
                 ''')
                 
+                # Merchant history is read newest first and paged by (timestamp, transaction_id)
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_transactions_merchant_time
+                    ON transactions (merchant_id, timestamp DESC, transaction_id DESC)
+                ''')
+                
+                # Only unprocessed notifications are polled, so index just those rows
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_mti_notifications_pending
+                    ON mti_notifications (timestamp) WHERE processed = 0
+                ''')
+                
+                # Merchant notification listings join from transactions on transaction_id
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_mti_notifications_transaction
+                    ON mti_notifications (transaction_id)
+                ''')
+                
+                # Refresh planner statistics where they are missing or stale; cheap
+                # when nothing changed, and never analyzes the empty tables of a new file
+                conn.execute('PRAGMA optimize')
+                
             logger.info("Database initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize database: {str(e)}")
     
     def add_merchant(self, merchant_data: Dict[str, Any]) -> bool:
-        """Add a new merchant to the database"""
+        """
+        Add a new merchant to the database
+        
+        Args:
+            merchant_data: Merchant fields; password_hash must already be derived by
+                the caller, since key derivation is deliberately slow and would hold
+                the write lock for its whole duration if done here
+        """
+        params = (
+            merchant_data['merchant_id'],
+            merchant_data['merchant_name'],
+            merchant_data['email'],
+            merchant_data['password_hash'],
+            merchant_data.get('bank_account'),
+            merchant_data.get('crypto_wallet')
+        )
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    INSERT INTO merchants 
-                    (merchant_id, merchant_name, email, password_hash, bank_account, crypto_wallet)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    merchant_data['merchant_id'],
-                    merchant_data['merchant_name'],
-                    merchant_data['email'],
-                    merchant_data['password_hash'],
-                    merchant_data.get('bank_account'),
-                    merchant_data.get('crypto_wallet')
-                ))
+            with self._conn(write=True) as conn:
+                conn.execute(_SQL_INSERT_MERCHANT, params)
                 
-            logger.info(f"Merchant {merchant_data['merchant_id']} added successfully")
+            logger.debug("Merchant %s added successfully", merchant_data['merchant_id'])
+            self._merchant_changed(merchant_data['merchant_id'])
             return True
         except sqlite3.IntegrityError as e:
             logger.error(f"Failed to add merchant: {str(e)}")
             return False
     
-    def get_merchant(self, merchant_id: str) -> Optional[Dict[str, Any]]:
-        """Retrieve merchant information by merchant_id"""
+    def get_merchant(self, merchant_id: str, as_dict: bool = True) -> Optional[Union[Dict[str, Any], sqlite3.Row]]:
+        """Retrieve merchant information by merchant_id; as_dict=False returns the sqlite3.Row"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                cursor.execute('SELECT * FROM merchants WHERE merchant_id = ?', (merchant_id,))
-                row = cursor.fetchone()
+            with self._conn() as conn:
+                row = conn.execute(_SQL_GET_MERCHANT, (merchant_id,)).fetchone()
                 
             if row:
-                return dict(row)
+                return dict(row) if as_dict else row
             return None
         except Exception as e:
             logger.error(f"Failed to retrieve merchant: {str(e)}")
             return None
     
+    def get_merchant_record(self, merchant_id: str) -> Optional[Merchant]:
+        """Retrieve a merchant as a Merchant record, which excludes the password hash"""
+        try:
+            with self._conn() as conn:
+                row = conn.execute(_SQL_GET_MERCHANT_RECORD, (merchant_id,)).fetchone()
+                
+            if row:
+                return Merchant.from_row(row)
+            return None
+        except Exception as e:
+            logger.error(f"Failed to retrieve merchant record: {str(e)}")
+            return None
+    
     def get_merchant_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Retrieve merchant information by email"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                cursor.execute('SELECT * FROM merchants WHERE email = ?', (email,))
-                row = cursor.fetchone()
+            with self._conn() as conn:
+                row = conn.execute(_SQL_GET_MERCHANT_BY_EMAIL, (email,)).fetchone()
                 
             if row:
                 return dict(row)
@@ -138,6 +393,24 @@ class DatabaseManager:
             logger.error(f"Failed to retrieve merchant by email: {str(e)}")
             return None
     
+    def get_merchant_auth(self, email: str) -> Optional[Tuple[str, str, str]]:
+        """
+        Retrieve (merchant_id, merchant_name, password_hash) for a login email
+        
+        The connection is back in the pool before this returns, so the caller
+        verifies the password without holding any database resources.
+        """
+        try:
+            with self._conn() as conn:
+                row = conn.execute(_SQL_GET_MERCHANT_AUTH, (email,)).fetchone()
+                
+            if row:
+                return tuple(row)
+            return None
+        except Exception as e:
+            logger.error(f"Failed to retrieve merchant credentials: {str(e)}")
+            return None
+    
     def update_merchant_payout(self, merchant_id: str, bank_account: str = None, 
                               crypto_wallet: str = None) -> bool:
         """Update merchant payout information"""
@@ -145,176 +418,286 @@ class DatabaseManager:
             logger.warning("No payout info provided to update")
             return False
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                if bank_account and crypto_wallet:
-                    cursor.execute('''
-                        UPDATE merchants 
-                        SET bank_account = ?, crypto_wallet = ?
-                        WHERE merchant_id = ?
-                    ''', (bank_account, crypto_wallet, merchant_id))
-                elif bank_account:
-                    cursor.execute('''
-                        UPDATE merchants 
-                        SET bank_account = ?
-                        WHERE merchant_id = ?
-                    ''', (bank_account, merchant_id))
-                elif crypto_wallet:
-                    cursor.execute('''
-                        UPDATE merchants 
-                        SET crypto_wallet = ?
-                        WHERE merchant_id = ?
-                    ''', (crypto_wallet, merchant_id))
+            with self._conn(write=True) as conn:
+                # A NULL parameter leaves that column as it is
+                conn.execute(_SQL_UPDATE_MERCHANT_PAYOUT,
+                             (bank_account or None, crypto_wallet or None, merchant_id))
                 
-            logger.info(f"Merchant {merchant_id} payout information updated")
+            logger.debug("Merchant %s payout information updated", merchant_id)
+            self._merchant_changed(merchant_id)
             return True
         except Exception as e:
             logger.error(f"Failed to update merchant payout: {str(e)}")
             return False
     
+    def update_merchant_password_hash(self, merchant_id: str, password_hash: bytes,
+                                      old_hash: Union[bytes, str]) -> bool:
+        """
+        Replace a merchant's stored password hash
+        
+        Args:
+            merchant_id: The merchant ID
+            password_hash: The new salt + digest BLOB
+            old_hash: The hash being replaced; nothing is written if it has changed since
+            
+        Returns:
+            bool: Whether the hash was replaced
+        """
+        try:
+            with self._conn(write=True) as conn:
+                updated = conn.execute(_SQL_UPDATE_MERCHANT_PASSWORD_HASH,
+                                       (password_hash, merchant_id, old_hash)).rowcount
+                
+            if updated:
+                self._merchant_changed(merchant_id)
+            return bool(updated)
+        except Exception as e:
+            logger.error(f"Failed to update merchant password hash: {str(e)}")
+            return False
+    
+    @staticmethod
+    def _transaction_row(transaction_data: Dict[str, Any]) -> tuple:
+        """Bind a transaction dict to the _SQL_INSERT_TRANSACTION parameters"""
+        return (
+            transaction_data['transaction_id'],
+            transaction_data['timestamp'],
+            transaction_data['amount'],
+            transaction_data['currency'],
+            transaction_data['transaction_type'],
+            transaction_data['payment_method'],
+            transaction_data['protocol'],
+            transaction_data['merchant_id'],
+            transaction_data['terminal_id'],
+            int(transaction_data['is_online']),
+            transaction_data['status'],
+            transaction_data.get('approval_code'),
+            transaction_data.get('response_code'),
+            transaction_data.get('response_message'),
+            transaction_data.get('mti'),
+            transaction_data.get('trace_number'),
+            transaction_data.get('batch_number')
+        )
+    
     def save_transaction(self, transaction_data: Dict[str, Any]) -> bool:
         """Save transaction data to the database"""
+        return self.save_transactions([transaction_data]) == 1
+    
+    def save_transactions(self, transactions: Iterable[Dict[str, Any]]) -> int:
+        """
+        Save several transactions in a single database transaction
+        
+        Args:
+            transactions: Transaction dicts, as produced by Transaction.to_dict
+            
+        Returns:
+            int: Number of transactions saved; 0 if the batch was rolled back
+        """
+        rows = [self._transaction_row(transaction_data) for transaction_data in transactions]
+        if not rows:
+            return 0
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    INSERT INTO transactions 
-                    (transaction_id, timestamp, amount, currency, transaction_type, payment_method,
-                     protocol, merchant_id, terminal_id, is_online, status, approval_code,
-                     response_code, response_message, mti, trace_number, batch_number)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    transaction_data['transaction_id'],
-                    transaction_data['timestamp'],
-                    transaction_data['amount'],
-                    transaction_data['currency'],
-                    transaction_data['transaction_type'],
-                    transaction_data['payment_method'],
-                    transaction_data['protocol'],
-                    transaction_data['merchant_id'],
-                    transaction_data['terminal_id'],
-                    int(transaction_data['is_online']),
-                    transaction_data['status'],
-                    transaction_data.get('approval_code'),
-                    transaction_data.get('response_code'),
-                    transaction_data.get('response_message'),
-                    transaction_data.get('mti'),
-                    transaction_data.get('trace_number'),
-                    transaction_data.get('batch_number')
-                ))
+            with self._conn(write=True) as conn:
+                conn.executemany(_SQL_INSERT_TRANSACTION, rows)
                 
-            logger.info(f"Transaction {transaction_data['transaction_id']} saved successfully")
-            return True
+            if len(rows) == 1:
+                logger.debug("Transaction %s saved successfully", rows[0][0])
+            else:
+                logger.debug("%d transactions saved successfully", len(rows))
+            return len(rows)
         except Exception as e:
-            logger.error(f"Failed to save transaction: {str(e)}")
-            return False
+            logger.error(f"Failed to save transactions: {str(e)}")
+            return 0
     
     def update_transaction(self, transaction_id: str, status: str, 
                           approval_code: str = None, response_code: str = None, 
                           response_message: str = None) -> bool:
         """Update transaction status and related information"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                if approval_code:
-                    cursor.execute('''
-                        UPDATE transactions 
-                        SET status = ?, approval_code = ?, response_code = ?, response_message = ?
-                        WHERE transaction_id = ?
-                    ''', (status, approval_code, response_code, response_message, transaction_id))
-                else:
-                    cursor.execute('''
-                        UPDATE transactions 
-                        SET status = ?, response_code = ?, response_message = ?
-                        WHERE transaction_id = ?
-                    ''', (status, response_code, response_message, transaction_id))
+            with self._conn(write=True) as conn:
+                # A NULL approval code keeps the one already recorded
+                conn.execute(_SQL_UPDATE_TRANSACTION,
+                             (status, approval_code or None, response_code, response_message, transaction_id))
                 
-            logger.info(f"Transaction {transaction_id} updated successfully")
+            logger.debug("Transaction %s updated successfully", transaction_id)
             return True
         except Exception as e:
             logger.error(f"Failed to update transaction: {str(e)}")
             return False
     
-    def get_transaction(self, transaction_id: str) -> Optional[Dict[str, Any]]:
-        """Retrieve transaction by transaction_id"""
+    def get_transaction(self, transaction_id: str,
+                        as_dict: bool = True) -> Optional[Union[Dict[str, Any], sqlite3.Row]]:
+        """Retrieve transaction by transaction_id; as_dict=False returns the sqlite3.Row"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                cursor.execute('SELECT * FROM transactions WHERE transaction_id = ?', (transaction_id,))
-                row = cursor.fetchone()
+            with self._conn() as conn:
+                row = conn.execute(_SQL_GET_TRANSACTION, (transaction_id,)).fetchone()
                 
             if row:
-                return dict(row)
+                return dict(row) if as_dict else row
             return None
         except Exception as e:
             logger.error(f"Failed to retrieve transaction: {str(e)}")
             return None
     
-    def get_merchant_transactions(self, merchant_id: str) -> List[Dict[str, Any]]:
-        """Retrieve all transactions for a merchant"""
+    def get_transaction_status(self, transaction_id: str) -> Optional[Tuple[str, Optional[str]]]:
+        """Retrieve (status, approval_code) for a transaction"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
+            with self._conn() as conn:
+                row = conn.execute(_SQL_GET_TRANSACTION_STATUS, (transaction_id,)).fetchone()
                 
-                cursor.execute('SELECT * FROM transactions WHERE merchant_id = ? ORDER BY timestamp DESC', 
-                              (merchant_id,))
-                rows = cursor.fetchall()
+            if row:
+                return tuple(row)
+            return None
+        except Exception as e:
+            logger.error(f"Failed to retrieve transaction status: {str(e)}")
+            return None
+    
+    def get_transactions_by_ids(self, transaction_ids: Iterable[str],
+                                as_dict: bool = True) -> Dict[str, Union[Dict[str, Any], sqlite3.Row]]:
+        """Retrieve several transactions in one query, keyed by transaction_id"""
+        ids = list(set(transaction_ids))
+        if not ids:
+            return {}
+        try:
+            with self._conn() as conn:
+                placeholders = ', '.join('?' * len(ids))
+                rows = conn.execute(f'SELECT {_TRANSACTION_COLUMNS} FROM transactions WHERE transaction_id IN ({placeholders})', ids).fetchall()
                 
-            return [dict(row) for row in rows]
+            if not as_dict:
+                return {row['transaction_id']: row for row in rows}
+            return {row['transaction_id']: dict(row) for row in rows}
+        except Exception as e:
+            logger.error(f"Failed to retrieve transactions: {str(e)}")
+            return {}
+    
+    def get_merchant_transactions(self, merchant_id: str, limit: Optional[int] = None,
+                                  after_id: Optional[str] = None,
+                                  as_dict: bool = True) -> List[Union[Dict[str, Any], sqlite3.Row]]:
+        """
+        Retrieve transactions for a merchant, newest first
+        
+        Args:
+            merchant_id: The merchant ID
+            limit: Optional maximum number of transactions to return
+            after_id: Optional keyset cursor; only transactions older than this one are returned
+            as_dict: Convert rows to dicts; pass False to get the sqlite3.Row objects as they are
+        """
+        try:
+            return list(self.iter_merchant_transactions(
+                merchant_id, limit=limit, after_id=after_id, as_dict=as_dict
+            ))
         except Exception as e:
             logger.error(f"Failed to retrieve merchant transactions: {str(e)}")
             return []
     
-    def add_mti_notification(self, mti: str, transaction_id: str, message: str) -> bool:
-        """Add an MTI notification to the database"""
+    def iter_merchant_transactions(self, merchant_id: str, limit: Optional[int] = None,
+                                   after_id: Optional[str] = None, as_dict: bool = True,
+                                   batch: int = 500) -> Iterator[Union[Dict[str, Any], sqlite3.Row]]:
+        """
+        Stream transactions for a merchant, newest first
+        
+        The pooled connection is held until the iterator is exhausted or closed,
+        so consume it promptly. Database errors are raised to the caller.
+        
+        Args:
+            merchant_id: The merchant ID
+            limit: Optional maximum number of transactions to yield
+            after_id: Optional keyset cursor; only transactions older than this one are yielded
+            as_dict: Convert rows to dicts; pass False to get the sqlite3.Row objects as they are
+            batch: Number of rows fetched from SQLite at a time
+        """
+        query = f'SELECT {_TRANSACTION_COLUMNS} FROM transactions WHERE merchant_id = ?'
+        params: List[Any] = [merchant_id]
+        if after_id is not None:
+            query += (' AND (timestamp, transaction_id) < '
+                      '(SELECT timestamp, transaction_id FROM transactions WHERE transaction_id = ?)')
+            params.append(after_id)
+        query += ' ORDER BY timestamp DESC, transaction_id DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        
+        with self._conn() as conn:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    break
+                if as_dict:
+                    yield from map(dict, rows)
+                else:
+                    yield from rows
+    
+    def add_mti_notification(self, mti: str, transaction_id: str,
+                             message: Union[str, bytes]) -> Optional[int]:
+        """Add an MTI notification (message as str or UTF-8 bytes), returning its id (None on failure)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    INSERT INTO mti_notifications 
-                    (mti, transaction_id, message, timestamp)
-                    VALUES (?, ?, ?, ?)
-                ''', (mti, transaction_id, message, datetime.now().isoformat()))
+            with self._conn(write=True) as conn:
+                notification_id = conn.execute(
+                    _SQL_INSERT_MTI_NOTIFICATION, (mti, transaction_id, message)
+                ).fetchone()[0]
                 
-            logger.info(f"MTI notification for transaction {transaction_id} added successfully")
-            return True
+            logger.debug(
+                "MTI notification %s for transaction %s added successfully",
+                notification_id, transaction_id
+            )
+            return notification_id
         except Exception as e:
             logger.error(f"Failed to add MTI notification: {str(e)}")
-            return False
+            return None
     
     def get_pending_mti_notifications(self) -> List[Dict[str, Any]]:
         """Retrieve all pending MTI notifications"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                cursor.execute('SELECT * FROM mti_notifications WHERE processed = 0 ORDER BY timestamp ASC')
-                rows = cursor.fetchall()
+            with self._conn() as conn:
+                rows = conn.execute(_SQL_GET_PENDING_MTI_NOTIFICATIONS).fetchall()
                 
             return [dict(row) for row in rows]
         except Exception as e:
             logger.error(f"Failed to retrieve pending MTI notifications: {str(e)}")
             return []
     
-    def mark_mti_notification_processed(self, notification_id: int) -> bool:
-        """Mark an MTI notification as processed"""
+    def get_merchant_mti_notifications(self, merchant_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Retrieve a merchant's most recent MTI notifications, processed or not
+        
+        Args:
+            merchant_id: The merchant ID
+            limit: Maximum number of notifications to return
+            
+        Returns:
+            List[Dict[str, Any]]: Notifications, newest transaction first
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
+            with self._conn() as conn:
+                rows = conn.execute(_SQL_GET_MERCHANT_MTI_NOTIFICATIONS, (merchant_id, limit)).fetchall()
                 
-                cursor.execute('UPDATE mti_notifications SET processed = 1 WHERE id = ?', 
-                              (notification_id,))
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Failed to retrieve MTI notifications for merchant {merchant_id}: {str(e)}")
+            return []
+    
+    def claim_pending_mti_notifications(self) -> List[Dict[str, Any]]:
+        """
+        Mark all pending MTI notifications as processed and return them
+        
+        Selecting and marking happen in a single UPDATE ... RETURNING, so a
+        notification is handed to exactly one caller even with several workers.
+        
+        Returns:
+            List[Dict[str, Any]]: The claimed notifications, oldest first
+        """
+        try:
+            with self._conn(write=True) as conn:
+                cursor = conn.execute(_SQL_CLAIM_PENDING_MTI_NOTIFICATIONS)
+                rows = cursor.fetchall()
+                columns = [column[0] for column in cursor.description]
                 
-            logger.info(f"MTI notification {notification_id} marked as processed")
-            return True
+            if rows:
+                logger.debug("%d MTI notifications claimed", len(rows))
+            # RETURNING gives no ordering guarantee; ISO timestamps sort as text
+            notifications = [dict(zip(columns, row)) for row in rows]
+            notifications.sort(key=lambda notification: (notification['timestamp'], notification['id']))
+            return notifications
         except Exception as e:
-            logger.error(f"Failed to mark MTI notification as processed: {str(e)}")
-            return False
+            logger.error(f"Failed to claim pending MTI notifications: {str(e)}")
+            return []
@@ -3,15 +3,29 @@ Black Rock Payment Terminal - Authentication Service
 """
 
 import hashlib
+import hmac
 import logging
-import secrets
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union
+from black_rock.config.settings import PASSWORD_HASHING
 from black_rock.models.database import DatabaseManager
+from black_rock.core.tokens import token_bytes, token_hex
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_SCRYPT_N = PASSWORD_HASHING["scrypt_n"]
+_SCRYPT_R = PASSWORD_HASHING["scrypt_r"]
+_SCRYPT_P = PASSWORD_HASHING["scrypt_p"]
+_SCRYPT_DKLEN = 32
+# Stored as a 48-byte BLOB: the raw salt followed by the raw scrypt digest
+_SALT_BYTES = 16
+_STORED_HASH_BYTES = _SALT_BYTES + _SCRYPT_DKLEN
+# Legacy rows are TEXT "<sha256 hex>:<salt hex>"; the salt has a fixed width
+# so the value can be split by offset
+_SALT_HEX_LEN = 2 * _SALT_BYTES
+# Verified against when an email is unknown, so that branch costs one scrypt
+# like a real login and response time does not reveal which emails exist
+_DUMMY_STORED_HASH = bytes(_STORED_HASH_BYTES)
+
 class AuthService:
     """Handles merchant authentication for the payment terminal"""
     
@@ -19,27 +33,59 @@ class AuthService:
         """Initialize authentication service with database manager"""
         self.db_manager = db_manager
     
-    def hash_password(self, password: str, salt: Optional[str] = None) -> tuple:
+    def hash_password(self, password: str, salt: Optional[bytes] = None) -> tuple:
         """
-        Hash a password with a salt
+        Hash a password with a salt using scrypt
         
         Args:
             password: The password to hash
-            salt: Optional salt (generated if not provided)
+            salt: Optional raw salt (generated if not provided)
             
         Returns:
-            tuple: (hashed_password, salt)
+            tuple: (digest, salt) as raw bytes; stored as salt + digest
         """
         if salt is None:
-            salt = secrets.token_hex(16)
+            salt = token_bytes(_SALT_BYTES)
         
-        # Combine password and salt
-        salted_password = password + salt
+        digest = hashlib.scrypt(
+            password.encode(), salt=salt,
+            n=_SCRYPT_N, r=_SCRYPT_R, p=_SCRYPT_P, dklen=_SCRYPT_DKLEN
+        )
         
-        # Hash the salted password
-        hashed = hashlib.sha256(salted_password.encode()).hexdigest()
+        return (digest, salt)
+    
+    def _verify_password(self, password: str, stored_hash: Union[bytes, str]) -> Optional[bool]:
+        """
+        Check a password against a stored hash, accepting legacy SHA-256 hashes
         
-        return (hashed, salt)
+        Args:
+            password: The password to check
+            stored_hash: The stored salt + digest BLOB, or a legacy "<hash>:<salt>" string
+            
+        Returns:
+            Optional[bool]: Whether the password matches; None if the stored hash is malformed
+        """
+        # Compare hashes in constant time so response timing reveals nothing
+        # about how much of the hash matched
+        if isinstance(stored_hash, bytes):
+            if len(stored_hash) != _STORED_HASH_BYTES:
+                return None
+            digest, _ = self.hash_password(password, stored_hash[:_SALT_BYTES])
+            return hmac.compare_digest(digest, stored_hash[_SALT_BYTES:])
+        
+        # Merchants registered before the scrypt change: sha256(password + salt)
+        if len(stored_hash) <= _SALT_HEX_LEN or stored_hash[-_SALT_HEX_LEN - 1] != ':':
+            return None
+        password_hash = stored_hash[:-_SALT_HEX_LEN - 1]
+        salt = stored_hash[-_SALT_HEX_LEN:]
+        hashed_password = hashlib.sha256((password + salt).encode()).hexdigest()
+        return hmac.compare_digest(hashed_password, password_hash)
+    
+    def _upgrade_password_hash(self, merchant_id: str, password: str, legacy_hash: str) -> None:
+        """Replace a verified legacy SHA-256 hash with a scrypt BLOB; login succeeds either way"""
+        digest, salt = self.hash_password(password)
+        if self.db_manager.update_merchant_password_hash(merchant_id, salt + digest, legacy_hash):
+            logger.info("Password hash for merchant %s upgraded to scrypt", merchant_id)
     
     def register_merchant(self, merchant_name: str, email: str, password: str, 
                          merchant_id: Optional[str] = None) -> Dict[str, Any]:
@@ -58,17 +104,17 @@ class AuthService:
         try:
             # Generate merchant ID if not provided
             if merchant_id is None:
-                merchant_id = secrets.token_hex(8)
+                merchant_id = token_hex(8)
             
             # Hash password
-            hashed_password, salt = self.hash_password(password)
+            digest, salt = self.hash_password(password)
             
             # Prepare merchant data
             merchant_data = {
                 'merchant_id': merchant_id,
                 'merchant_name': merchant_name,
                 'email': email,
-                'password_hash': f"{hashed_password}:{salt}",
+                'password_hash': salt + digest,
                 'bank_account': None,
                 'crypto_wallet': None
             }
@@ -77,23 +123,23 @@ class AuthService:
             success = self.db_manager.add_merchant(merchant_data)
             
             if success:
-                logger.info(f"Merchant {merchant_name} registered successfully")
+                logger.info("Merchant %s registered successfully", merchant_name)
                 return {
                     'success': True,
                     'merchant_id': merchant_id,
                     'message': 'Merchant registered successfully'
                 }
             else:
-                logger.warning(f"Failed to register merchant {merchant_name}")
+                logger.warning("Failed to register merchant %s", merchant_name)
                 return {
                     'success': False,
                     'message': 'Merchant registration failed. Email may already exist.'
                 }
-        except Exception as e:
-            logger.error(f"Error during merchant registration: {str(e)}")
+        except Exception:
+            logger.exception("Error during merchant registration for %s", email)
             return {
                 'success': False,
-                'message': f'Registration error: {str(e)}'
+                'message': 'Registration error'
             }
     
     def authenticate_merchant(self, email: str, password: str) -> Dict[str, Any]:
@@ -109,41 +155,47 @@ class AuthService:
         """
         try:
             # Get merchant from database
-            merchant = self.db_manager.get_merchant_by_email(email)
+            merchant = self.db_manager.get_merchant_auth(email)
             
             if not merchant:
-                logger.warning(f"Authentication failed: merchant with email {email} not found")
+                self._verify_password(password, _DUMMY_STORED_HASH)
+                logger.warning("Authentication failed: merchant with email %s not found", email)
                 return {
                     'success': False,
                     'message': 'Invalid email or password'
                 }
             
-            # Extract hash and salt
-            password_hash, salt = merchant['password_hash'].split(':')
-            
-            # Hash provided password with stored salt
-            hashed_password, _ = self.hash_password(password, salt)
+            merchant_id, merchant_name, stored_hash = merchant
             
-            # Compare hashes
-            if hashed_password == password_hash:
-                logger.info(f"Merchant {email} authenticated successfully")
+            # Hash provided password with stored salt and compare
+            verified = self._verify_password(password, stored_hash)
+            if verified is None:
+                logger.error("Malformed password hash for merchant %s", merchant_id)
+                return {
+                    'success': False,
+                    'message': 'Invalid email or password'
+                }
+            if verified:
+                if isinstance(stored_hash, str):
+                    self._upgrade_password_hash(merchant_id, password, stored_hash)
+                logger.info("Merchant %s authenticated successfully", email)
                 return {
                     'success': True,
-                    'merchant_id': merchant['merchant_id'],
-                    'merchant_name': merchant['merchant_name'],
+                    'merchant_id': merchant_id,
+                    'merchant_name': merchant_name,
                     'message': 'Authentication successful'
                 }
             else:
-                logger.warning(f"Authentication failed: invalid password for {email}")
+                logger.warning("Authentication failed: invalid password for %s", email)
                 return {
                     'success': False,
                     'message': 'Invalid email or password'
                 }
-        except Exception as e:
-            logger.error(f"Error during merchant authentication: {str(e)}")
+        except Exception:
+            logger.exception("Error during merchant authentication for %s", email)
             return {
                 'success': False,
-                'message': f'Authentication error: {str(e)}'
+                'message': 'Authentication error'
             }
     
     def get_merchant_info(self, merchant_id: str) -> Optional[Dict[str, Any]]:
@@ -157,11 +209,10 @@ class AuthService:
             Optional[Dict[str, Any]]: Merchant information or None if not found
         """
         try:
-            merchant = self.db_manager.get_merchant(merchant_id)
+            # The record never carries the password hash
+            merchant = self.db_manager.get_merchant_record(merchant_id)
             if merchant:
-                # Remove password hash from returned data
-                merchant.pop('password_hash', None)
-                return merchant
+                return merchant.to_dict()
             return None
         except Exception as e:
             logger.error(f"Error retrieving merchant info: {str(e)}")
@@ -3,17 +3,19 @@ Black Rock Payment Terminal - MTI Notification Service
 """
 
 import logging
-import json
 import threading
-import time
 from typing import Dict, Any, List
+import orjson
 from black_rock.models.database import DatabaseManager
-from black_rock.handlers.protocol_handler import MTIHandler
+from black_rock.config.settings import MTI_TYPES
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# The worker sleeps until a notification is created; this bounds the wait so
+# notifications written by other processes are still picked up
+_POLL_TIMEOUT = 30.0
+_ERROR_BACKOFF = 10.0
+
 class NotificationService:
     """Handles MTI message notifications and processing"""
     
@@ -23,6 +25,10 @@ class NotificationService:
         self.notification_callbacks = []
         self.processing_thread = None
         self.stop_event = threading.Event()
+        # Signalled by create_mti_notification; _wakeup_pending covers a signal
+        # sent while the worker is busy rather than waiting
+        self._wakeup = threading.Condition()
+        self._wakeup_pending = False
         
     def add_notification_callback(self, callback) -> None:
         """
@@ -45,32 +51,50 @@ class NotificationService:
             self.notification_callbacks.remove(callback)
             logger.info("Notification callback removed")
     
+    def is_alive(self) -> bool:
+        """
+        Check whether the notification processing thread is running
+        
+        Returns:
+            bool: True if the processing thread is alive
+        """
+        return self.processing_thread is not None and self.processing_thread.is_alive()
+    
     def start_notification_processing(self) -> None:
-        """Start the notification processing thread"""
+        """Start the notification processing thread if it is not already running"""
+        if self.is_alive():
+            logger.info("Notification processing thread already running")
+            return
+        
         def processing_worker():
-            while not self.stop_event.is_set():
+            # Bound once; callbacks is the live list, so add/remove still apply
+            stopped = self.stop_event.is_set
+            claim_pending = self.db_manager.claim_pending_mti_notifications
+            callbacks = self.notification_callbacks
+            wait_for_wakeup = self._wait_for_wakeup
+            backoff = self.stop_event.wait
+            
+            while not stopped():
                 try:
-                    # Get pending notifications
-                    pending_notifications = self.db_manager.get_pending_mti_notifications()
+                    # Fetch and mark pending notifications in one statement, so no
+                    # other worker can deliver them again
+                    pending_notifications = claim_pending()
                     
                     if pending_notifications:
                         # Notify all callbacks
-                        for callback in self.notification_callbacks:
+                        for callback in callbacks:
                             try:
                                 callback(pending_notifications)
                             except Exception as e:
                                 logger.error(f"Error in notification callback: {str(e)}")
-                        
-                        # Mark notifications as processed
-                        for notification in pending_notifications:
-                            self.db_manager.mark_mti_notification_processed(notification['id'])
                     
-                    # Wait before next check
-                    time.sleep(5)
+                    # Wait for the next notification (or the safety-net timeout)
+                    wait_for_wakeup(_POLL_TIMEOUT)
                 except Exception as e:
                     logger.error(f"Error in notification processing: {str(e)}")
-                    time.sleep(10)
+                    backoff(_ERROR_BACKOFF)
         
+        self.stop_event.clear()
         self.processing_thread = threading.Thread(target=processing_worker, daemon=True)
         self.processing_thread.start()
         logger.info("Notification processing thread started")
@@ -78,10 +102,25 @@ class NotificationService:
     def stop_notification_processing(self) -> None:
         """Stop the notification processing thread"""
         self.stop_event.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
         if self.processing_thread:
             self.processing_thread.join(timeout=5.0)
         logger.info("Notification processing thread stopped")
     
+    def _notify_worker(self) -> None:
+        """Wake the processing thread so a new notification is delivered promptly"""
+        with self._wakeup:
+            self._wakeup_pending = True
+            self._wakeup.notify()
+    
+    def _wait_for_wakeup(self, timeout: float) -> None:
+        """Block until a notification is created, processing stops, or timeout elapses"""
+        with self._wakeup:
+            if not self._wakeup_pending and not self.stop_event.is_set():
+                self._wakeup.wait(timeout)
+            self._wakeup_pending = False
+    
     def create_mti_notification(self, mti: str, transaction_id: str, 
                               additional_data: Dict[str, Any] = None) -> bool:
         """
@@ -96,14 +135,12 @@ class NotificationService:
             bool: True if successful, False otherwise
         """
         try:
-            # Validate MTI
-            if not MTIHandler.validate_mti(mti):
-                logger.warning(f"Invalid MTI code: {mti}")
+            # Validate MTI and get its description in one lookup
+            description = MTI_TYPES.get(mti)
+            if description is None:
+                logger.warning("Invalid MTI code: %s", mti)
                 return False
             
-            # Get MTI description
-            description = MTIHandler.get_mti_description(mti)
-            
             # Prepare notification message
             message_data = {
                 'mti': mti,
@@ -114,16 +151,22 @@ class NotificationService:
             if additional_data:
                 message_data.update(additional_data)
             
-            message = json.dumps(message_data)
+            # Non-string keys are stringified, as json.dumps did. The UTF-8 bytes
+            # are stored as TEXT by SQLite, so no decode is needed here
+            message = orjson.dumps(message_data, option=orjson.OPT_NON_STR_KEYS)
             
             # Save notification to database
-            success = self.db_manager.add_mti_notification(mti, transaction_id, message)
+            notification_id = self.db_manager.add_mti_notification(mti, transaction_id, message)
             
-            if success:
-                logger.info(f"MTI notification {mti} created for transaction {transaction_id}")
+            if notification_id is not None:
+                self._notify_worker()
+                logger.info(
+                    "MTI notification %s (%s) created for transaction %s",
+                    notification_id, mti, transaction_id
+                )
                 return True
             else:
-                logger.warning(f"Failed to create MTI notification {mti} for transaction {transaction_id}")
+                logger.warning("Failed to create MTI notification %s for transaction %s", mti, transaction_id)
                 return False
                 
         except Exception as e:
@@ -142,3 +185,23 @@ class NotificationService:
         except Exception as e:
             logger.error(f"Error retrieving pending notifications: {str(e)}")
             return []
+    
+    def get_merchant_notifications(self, merchant_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Get a merchant's most recent MTI notifications
+        
+        Pending notifications are delivered by the worker within moments, so
+        listings include processed ones rather than only the pending queue.
+        
+        Args:
+            merchant_id: The merchant ID
+            limit: Maximum number of notifications to return
+            
+        Returns:
+            List[Dict[str, Any]]: Notifications, newest transaction first
+        """
+        try:
+            return self.db_manager.get_merchant_mti_notifications(merchant_id, limit)
+        except Exception as e:
+            logger.error(f"Error retrieving notifications for merchant {merchant_id}: {str(e)}")
+            return []
@@ -3,12 +3,10 @@ Black Rock Payment Terminal - Payout Service
 """
 
 import logging
-import secrets
 from typing import Dict, Any, Optional
 from black_rock.models.database import DatabaseManager
+from black_rock.core.tokens import token_hex
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class PayoutService:
@@ -33,20 +31,21 @@ class PayoutService:
             Dict[str, Any]: Payout result
         """
         try:
-            # Get merchant payout information
-            merchant = self.db_manager.get_merchant(merchant_id)
+            # Read the destination fresh; an account changed by another
+            # worker must never be paid from a cached copy
+            merchant = self.db_manager.get_merchant_record(merchant_id)
             
             if not merchant:
-                logger.warning(f"Bank payout failed: merchant {merchant_id} not found")
+                logger.warning("Bank payout failed: merchant %s not found", merchant_id)
                 return {
                     'success': False,
                     'message': 'Merchant not found'
                 }
             
-            bank_account = merchant.get('bank_account')
+            bank_account = merchant.bank_account
             
             if not bank_account:
-                logger.warning(f"Bank payout failed: no bank account for merchant {merchant_id}")
+                logger.warning("Bank payout failed: no bank account for merchant %s", merchant_id)
                 return {
                     'success': False,
                     'message': 'No bank account configured for merchant'
@@ -54,9 +53,9 @@ class PayoutService:
             
             # In a real implementation, this would connect to a banking API
             # For now, we'll simulate a successful bank transfer
-            payout_id = secrets.token_hex(12)
+            payout_id = token_hex(12)
             
-            logger.info(f"Bank payout {payout_id} processed for merchant {merchant_id}")
+            logger.info("Bank payout %s processed for merchant %s", payout_id, merchant_id)
             return {
                 'success': True,
                 'payout_id': payout_id,
@@ -68,11 +67,11 @@ class PayoutService:
                 'message': f'Bank payout of {amount} {currency} processed successfully'
             }
             
-        except Exception as e:
-            logger.error(f"Error processing bank payout: {str(e)}")
+        except Exception:
+            logger.exception("Error processing bank payout for merchant %s", merchant_id)
             return {
                 'success': False,
-                'message': f'Bank payout error: {str(e)}'
+                'message': 'Bank payout error'
             }
     
     def process_crypto_payout(self, merchant_id: str, amount: float, currency: str,
@@ -90,20 +89,21 @@ class PayoutService:
             Dict[str, Any]: Payout result
         """
         try:
-            # Get merchant payout information
-            merchant = self.db_manager.get_merchant(merchant_id)
+            # Read the destination fresh; an account changed by another
+            # worker must never be paid from a cached copy
+            merchant = self.db_manager.get_merchant_record(merchant_id)
             
             if not merchant:
-                logger.warning(f"Crypto payout failed: merchant {merchant_id} not found")
+                logger.warning("Crypto payout failed: merchant %s not found", merchant_id)
                 return {
                     'success': False,
                     'message': 'Merchant not found'
                 }
             
-            crypto_wallet = merchant.get('crypto_wallet')
+            crypto_wallet = merchant.crypto_wallet
             
             if not crypto_wallet:
-                logger.warning(f"Crypto payout failed: no crypto wallet for merchant {merchant_id}")
+                logger.warning("Crypto payout failed: no crypto wallet for merchant %s", merchant_id)
                 return {
                     'success': False,
                     'message': 'No crypto wallet configured for merchant'
@@ -111,9 +111,9 @@ class PayoutService:
             
             # In a real implementation, this would connect to a cryptocurrency API
             # For now, we'll simulate a successful crypto transfer
-            payout_id = secrets.token_hex(12)
+            payout_id = token_hex(12)
             
-            logger.info(f"Crypto payout {payout_id} processed for merchant {merchant_id}")
+            logger.info("Crypto payout %s processed for merchant %s", payout_id, merchant_id)
             return {
                 'success': True,
                 'payout_id': payout_id,
@@ -125,11 +125,11 @@ class PayoutService:
                 'message': f'Crypto payout of {amount} {currency} processed successfully'
             }
             
-        except Exception as e:
-            logger.error(f"Error processing crypto payout: {str(e)}")
+        except Exception:
+            logger.exception("Error processing crypto payout for merchant %s", merchant_id)
             return {
                 'success': False,
-                'message': f'Crypto payout error: {str(e)}'
+                'message': 'Crypto payout error'
             }
     
     def update_merchant_payout_info(self, merchant_id: str, bank_account: Optional[str] = None,
@@ -152,23 +152,23 @@ class PayoutService:
             )
             
             if success:
-                logger.info(f"Payout information updated for merchant {merchant_id}")
+                logger.info("Payout information updated for merchant %s", merchant_id)
                 return {
                     'success': True,
                     'message': 'Payout information updated successfully'
                 }
             else:
-                logger.warning(f"Failed to update payout information for merchant {merchant_id}")
+                logger.warning("Failed to update payout information for merchant %s", merchant_id)
                 return {
                     'success': False,
                     'message': 'Failed to update payout information'
                 }
                 
-        except Exception as e:
-            logger.error(f"Error updating merchant payout info: {str(e)}")
+        except Exception:
+            logger.exception("Error updating payout info for merchant %s", merchant_id)
             return {
                 'success': False,
-                'message': f'Update error: {str(e)}'
+                'message': 'Update error'
             }
     
     def get_merchant_payout_info(self, merchant_id: str) -> Optional[Dict[str, Any]]:
@@ -182,13 +182,14 @@ class PayoutService:
             Optional[Dict[str, Any]]: Payout information or None if not found
         """
         try:
-            merchant = self.db_manager.get_merchant(merchant_id)
+            merchant = self.db_manager.get_merchant_record(merchant_id)
             if merchant:
                 return {
-                    'merchant_id': merchant['merchant_id'],
-                    'merchant_name': merchant['merchant_name'],
-                    'bank_account': merchant.get('bank_account'),
-                    'crypto_wallet': merchant.get('crypto_wallet')
+                    'merchant_id': merchant.merchant_id,
+                    'merchant_name': merchant.merchant_name,
+                    'bank_account': merchant.bank_account,
+                    'crypto_wallet': merchant.crypto_wallet,
+                    'updated_at': merchant.updated_at or merchant.created_at
                 }
             return None
         except Exception as e:
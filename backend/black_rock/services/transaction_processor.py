@@ -2,27 +2,52 @@
 Black Rock Payment Terminal - Transaction Processor
 """
 
-import json
 import time
+import random
 import logging
 import datetime
 import threading
-from typing import Dict, Any, Optional, List, Tuple
+from collections import deque
+from typing import Dict, Any, Iterator, Optional, List, Tuple
 from enum import Enum
 import queue
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 
 from black_rock.core.transaction import Transaction, TransactionStatus, TransactionType
-from black_rock.handlers.protocol_handler import ProtocolFactory, ProtocolHandler
+from black_rock.handlers.protocol_handler import ProtocolFactory, ProtocolHandler, MTIHandler
+from black_rock.config.settings import PROTOCOLS
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# Offline transactions synced per pass of the sync thread
+OFFLINE_SYNC_BATCH_MAX = 50
+# Offline transactions synced concurrently; matches the owned session's
+# connection pool size and keeps a reconnect burst from swamping the server
+OFFLINE_SYNC_WORKERS = 4
+# Background intervals in seconds, spread by +/- _INTERVAL_JITTER so a fleet
+# started together does not hit the server in lockstep
+HEARTBEAT_INTERVAL = 60
+HEARTBEAT_RETRY_INTERVAL = 10
+# (connect, read) timeout for heartbeats; a liveness ping that takes longer than
+# this is treated as the server being down
+HEARTBEAT_TIMEOUT = (2.0, 3.0)
+OFFLINE_SYNC_RETRY_INTERVAL = 30
+_INTERVAL_JITTER = 0.1
+# Online retry delays: full jitter over base * 2**(retry - 1), capped, so
+# terminals retrying the same outage don't land on a shared schedule
+RETRY_BACKOFF_BASE = 1.0
+RETRY_BACKOFF_CAP = 30.0
+# Statuses meaning the server has no bulk offline sync endpoint
+_BULK_SYNC_UNSUPPORTED = (404, 405, 501)
+# Bodies are pre-encoded with orjson and sent as data=, so the type is set here
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# Transactions kept in memory for voids and history; the oldest are dropped first
+TRANSACTION_HISTORY_MAX = 10000
+
 
 class ProcessorStatus(Enum):
     """Status of the transaction processor"""
@@ -38,19 +63,70 @@ class TransactionProcessor:
     protocol handling, and server communication
     """
     
-    def __init__(self, merchant_id: str, terminal_id: str, server_url: str):
-        """Initialize the transaction processor"""
+    def __init__(self, merchant_id: str, terminal_id: str, server_url: str,
+                 http: Optional[requests.Session] = None,
+                 timeout: Tuple[float, float] = (3.0, 30.0)):
+        """
+        Initialize the transaction processor
+        
+        Args:
+            merchant_id: The merchant ID
+            terminal_id: The terminal ID
+            server_url: Base URL of the payment server
+            http: Optional shared HTTP session; keeps connections to the server alive across calls
+            timeout: (connect, read) timeout in seconds for server calls
+        """
         self.merchant_id = merchant_id
         self.terminal_id = terminal_id
         self.server_url = server_url
+        # A session passed in is shared and closed by its owner; one made here
+        # is private to this processor and closed in shutdown(). Retries are
+        # handled by _process_online, so the adapter never retries itself
+        self._owns_http = http is None
+        if http is None:
+            http = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+            http.mount('https://', adapter)
+            http.mount('http://', adapter)
+        self.http = http
+        # Heartbeats always go over a private single-connection session whose
+        # adapter never retries, so a shared session's retry policy cannot
+        # stretch HEARTBEAT_TIMEOUT when the server is down
+        self._heartbeat_http = requests.Session()
+        heartbeat_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+        self._heartbeat_http.mount('https://', heartbeat_adapter)
+        self._heartbeat_http.mount('http://', heartbeat_adapter)
+        self.timeout = timeout
+        self._heartbeat_url = f"{server_url}/heartbeat"
+        self._process_url = f"{server_url}/process"
+        self._sync_url = f"{server_url}/sync_offline"
+        self._sync_batch_url = f"{server_url}/sync_offline_batch"
+        # Cleared the first time the server answers that it has no bulk endpoint
+        self._bulk_sync_supported = True
         self.status = ProcessorStatus.IDLE
-        self.offline_queue = queue.Queue()
-        self.transaction_history = []
+        # SimpleQueue: request threads put and only the sync thread gets, so the
+        # task tracking and maxsize support of queue.Queue go unused
+        self.offline_queue = queue.SimpleQueue()
+        self.transaction_history = deque(maxlen=TRANSACTION_HISTORY_MAX)
+        # transaction_id -> Transaction for the entries in transaction_history
+        self._history_index: Dict[str, Transaction] = {}
+        self._history_lock = threading.Lock()
         self.is_online = True
         self.last_heartbeat = datetime.datetime.now()
+        # Monotonic time of the last successful server exchange; starts stale so
+        # the first heartbeat goes out immediately
+        self._last_contact = time.monotonic() - HEARTBEAT_INTERVAL
         self.heartbeat_thread = None
         self.offline_sync_thread = None
+        self._sync_pool: Optional[ThreadPoolExecutor] = None
         self.stop_threads = threading.Event()
+        self._offline_wakeup = threading.Event()
+        # Seeded from os.urandom, so workers and restarts sharing a terminal id
+        # still spread their heartbeats and retries independently
+        self._jitter = random.Random()
+        # (epoch second, ISO-8601 string) for the payload timestamps, kept as one
+        # tuple so concurrent readers never see a second paired with another's string
+        self._iso_cache: Tuple[int, str] = (0, "")
         
         logger.info(f"Transaction processor initialized for merchant {merchant_id}, terminal {terminal_id}")
         
@@ -60,71 +136,187 @@ class TransactionProcessor:
     def _start_heartbeat_thread(self) -> None:
         """Start the heartbeat thread to monitor server connectivity"""
         def heartbeat_worker():
-            while not self.stop_threads.is_set():
+            # Waiting on stop_threads rather than sleeping lets shutdown() end the
+            # loop at once, so no heartbeat is sent after it returns
+            while True:
                 try:
-                    self._send_heartbeat()
-                    time.sleep(60)  # Default heartbeat interval
+                    # Transactions answered by the server count as heartbeats, so
+                    # only ping when the terminal is idle or offline
+                    elapsed = time.monotonic() - self._last_contact
+                    if not self.is_online or elapsed >= HEARTBEAT_INTERVAL:
+                        self._send_heartbeat()
+                        # Probe more often while offline to notice recovery sooner
+                        interval = HEARTBEAT_INTERVAL if self.is_online else HEARTBEAT_RETRY_INTERVAL
+                    else:
+                        interval = HEARTBEAT_INTERVAL - elapsed
                 except Exception as e:
                     logger.error(f"Heartbeat error: {str(e)}")
-                    time.sleep(10)  # Shorter interval for retry
+                    interval = HEARTBEAT_RETRY_INTERVAL  # Shorter interval for retry
+                if self.stop_threads.wait(self._jittered(interval)):
+                    return
         
         self.heartbeat_thread = threading.Thread(target=heartbeat_worker, daemon=True)
         self.heartbeat_thread.start()
         logger.info("Heartbeat monitoring thread started")
     
+    def _jittered(self, interval: float) -> float:
+        """Spread an interval uniformly by +/- _INTERVAL_JITTER"""
+        return interval * (1 + self._jitter.uniform(-_INTERVAL_JITTER, _INTERVAL_JITTER))
+    
+    def _backoff(self, retry_count: int) -> float:
+        """Delay in seconds before retry number retry_count (1-based)"""
+        return self._jitter.uniform(
+            0, min(RETRY_BACKOFF_CAP, RETRY_BACKOFF_BASE * 2 ** (retry_count - 1))
+        )
+    
     def _start_offline_sync_thread(self) -> None:
         """Start the offline transaction synchronization thread"""
         def offline_sync_worker():
             while not self.stop_threads.is_set():
                 if self.is_online and not self.offline_queue.empty():
                     try:
-                        transaction = self.offline_queue.get(block=False)
-                        logger.info(f"Attempting to sync offline transaction {transaction.transaction_id}")
-                        success = self._sync_offline_transaction(transaction)
-                        if success:
-                            logger.info(f"Successfully synced offline transaction {transaction.transaction_id}")
-                        else:
-                            logger.warning(f"Failed to sync offline transaction {transaction.transaction_id}, requeuing")
-                            self.offline_queue.put(transaction)
-                    except queue.Empty:
-                        pass
+                        if self._sync_offline_batch() == OFFLINE_SYNC_BATCH_MAX:
+                            # A full batch went through; go straight on to the next
+                            self._offline_wakeup.set()
                     except Exception as e:
                         logger.error(f"Error in offline sync: {str(e)}")
-                time.sleep(30)  # Check every 30 seconds
+                # Woken by new offline transactions, reconnection or shutdown; the
+                # timeout retries transactions whose sync failed
+                self._offline_wakeup.wait(timeout=self._jittered(OFFLINE_SYNC_RETRY_INTERVAL))
+                self._offline_wakeup.clear()
         
+        if self._sync_pool is None:
+            self._sync_pool = ThreadPoolExecutor(
+                max_workers=OFFLINE_SYNC_WORKERS, thread_name_prefix="offline-sync"
+            )
         self.offline_sync_thread = threading.Thread(target=offline_sync_worker, daemon=True)
         self.offline_sync_thread.start()
         logger.info("Offline transaction sync thread started")
     
+    def _sync_offline_batch(self) -> int:
+        """
+        Sync up to OFFLINE_SYNC_BATCH_MAX queued offline transactions
+        
+        The batch goes to the server's bulk endpoint in one request. Servers
+        without one get the transactions OFFLINE_SYNC_WORKERS at a time on the
+        sync pool instead, sharing the session's keep-alive connections, and
+        that pass stops after a round with any failure since the rest would
+        most likely fail the same way. Unsynced transactions are requeued.
+        
+        Returns:
+            int: Number of transactions synced
+        """
+        # Read once: shutdown() drops the pool while this thread may still be running
+        pool = self._sync_pool
+        if pool is None:
+            return 0
+        transactions = []
+        for _ in range(OFFLINE_SYNC_BATCH_MAX):
+            try:
+                transactions.append(self.offline_queue.get(block=False))
+            except queue.Empty:
+                break
+        if not transactions:
+            return 0
+        
+        for transaction in transactions:
+            logger.info("Attempting to sync offline transaction %s", transaction.transaction_id)
+        
+        results = None
+        if self._bulk_sync_supported:
+            results = self._sync_offline_bulk(transactions)
+            if results is None:
+                logger.info("Server has no bulk offline sync endpoint; syncing transactions individually")
+                self._bulk_sync_supported = False
+        if results is None:
+            results = []
+            for start in range(0, len(transactions), OFFLINE_SYNC_WORKERS):
+                round_results = list(pool.map(
+                    self._sync_offline_transaction, transactions[start:start + OFFLINE_SYNC_WORKERS]
+                ))
+                results += round_results
+                if not all(round_results):
+                    break
+        
+        synced = 0
+        for index, transaction in enumerate(transactions):
+            if index < len(results) and results[index]:
+                logger.info("Successfully synced offline transaction %s", transaction.transaction_id)
+                synced += 1
+            else:
+                if index < len(results):
+                    logger.warning("Failed to sync offline transaction %s, requeuing", transaction.transaction_id)
+                self.offline_queue.put(transaction)
+        return synced
+    
+    def _sync_offline_bulk(self, transactions: List[Transaction]) -> Optional[List[bool]]:
+        """
+        Sync several offline transactions in a single request
+        
+        Args:
+            transactions: The transactions to sync
+            
+        Returns:
+            Optional[List[bool]]: Whether each transaction synced, in order, or
+                None if the server has no bulk endpoint
+        """
+        try:
+            payload = {
+                "transactions": [transaction.to_dict() for transaction in transactions],
+                "terminal_id": self.terminal_id,
+                "merchant_id": self.merchant_id,
+                "sync_timestamp": self._now_iso()
+            }
+            
+            response = self.http.post(
+                self._sync_batch_url,
+                data=orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS),
+                headers=_JSON_HEADERS,
+                timeout=self.timeout
+            )
+            
+            if response.status_code in _BULK_SYNC_UNSUPPORTED:
+                return None
+            if response.status_code != 200:
+                logger.warning(f"Bulk offline sync failed with status code {response.status_code}")
+                return [False] * len(transactions)
+            
+            # One result per transaction; any the server left out count as failed
+            response_data = orjson.loads(response.content)
+            results = {
+                result.get("transaction_id"): result
+                for result in response_data.get("results", [])
+            }
+            return [
+                transaction.transaction_id in results
+                and self._apply_sync_result(transaction, results[transaction.transaction_id])
+                for transaction in transactions
+            ]
+                
+        except Exception as e:
+            logger.error(f"Error in bulk offline sync: {str(e)}")
+            return [False] * len(transactions)
+    
     def _send_heartbeat(self) -> None:
         """Send a heartbeat message to the server to check connectivity"""
         try:
             payload = {
                 "terminal_id": self.terminal_id,
                 "merchant_id": self.merchant_id,
-                "timestamp": datetime.datetime.now().isoformat(),
+                "timestamp": self._now_iso(),
                 "message_type": "heartbeat"
             }
             
-            response = requests.post(
-                f"{self.server_url}/heartbeat",
-                json=payload,
-                timeout=30  # Default timeout
+            response = self._heartbeat_http.post(
+                self._heartbeat_url,
+                data=orjson.dumps(payload),
+                headers=_JSON_HEADERS,
+                timeout=HEARTBEAT_TIMEOUT
             )
             
             if response.status_code == 200:
-                self.is_online = True
-                self.last_heartbeat = datetime.datetime.now()
                 logger.debug("Heartbeat successful")
-                
-                # If we were offline before, log the reconnection
-                if self.status == ProcessorStatus.OFFLINE:
-                    logger.info("Terminal is back online")
-                    self.status = ProcessorStatus.IDLE
-                    
-                    # Start offline sync if not already running
-                    if not self.offline_sync_thread or not self.offline_sync_thread.is_alive():
-                        self._start_offline_sync_thread()
+                self._mark_online()
             else:
                 logger.warning(f"Heartbeat failed with status code {response.status_code}")
                 self._handle_offline_mode()
@@ -136,6 +328,32 @@ class TransactionProcessor:
             logger.error(f"Unexpected error in heartbeat: {str(e)}")
             self._handle_offline_mode()
     
+    def _now_iso(self) -> str:
+        """Current local time as ISO-8601, formatted at most once per second"""
+        now = int(time.time())
+        cached_sec, cached_str = self._iso_cache
+        if now == cached_sec:
+            return cached_str
+        iso = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(now))
+        self._iso_cache = (now, iso)
+        return iso
+    
+    def _mark_online(self) -> None:
+        """Record a successful exchange with the server, from a heartbeat or a transaction"""
+        self.is_online = True
+        self.last_heartbeat = datetime.datetime.now()
+        self._last_contact = time.monotonic()
+        
+        # If we were offline before, log the reconnection
+        if self.status == ProcessorStatus.OFFLINE:
+            logger.info("Terminal is back online")
+            self.status = ProcessorStatus.IDLE
+            
+            # Start offline sync if not already running, and flush the queue now
+            if not self.offline_sync_thread or not self.offline_sync_thread.is_alive():
+                self._start_offline_sync_thread()
+            self._offline_wakeup.set()
+    
     def _handle_offline_mode(self) -> None:
         """Handle transition to offline mode"""
         if self.is_online:
@@ -154,27 +372,18 @@ class TransactionProcessor:
                 "transaction": transaction.to_dict(),
                 "terminal_id": self.terminal_id,
                 "merchant_id": self.merchant_id,
-                "sync_timestamp": datetime.datetime.now().isoformat()
+                "sync_timestamp": self._now_iso()
             }
             
-            response = requests.post(
-                f"{self.server_url}/sync_offline",
-                json=payload,
-                timeout=30  # Default timeout
+            response = self.http.post(
+                self._sync_url,
+                data=orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS),
+                headers=_JSON_HEADERS,
+                timeout=self.timeout
             )
             
             if response.status_code == 200:
-                response_data = response.json()
-                if response_data.get("status") == "success":
-                    # Update the transaction with server response if needed
-                    if "server_approval_code" in response_data:
-                        transaction.approval_code = response_data["server_approval_code"]
-                    
-                    logger.info(f"Offline transaction {transaction.transaction_id} successfully synced")
-                    return True
-                else:
-                    logger.warning(f"Server rejected offline transaction: {response_data.get('message', 'Unknown error')}")
-                    return False
+                return self._apply_sync_result(transaction, orjson.loads(response.content))
             else:
                 logger.warning(f"Offline sync failed with status code {response.status_code}")
                 return False
@@ -183,6 +392,19 @@ class TransactionProcessor:
             logger.error(f"Error syncing offline transaction: {str(e)}")
             return False
     
+    def _apply_sync_result(self, transaction: Transaction, result: Dict[str, Any]) -> bool:
+        """Apply the server's answer for one synced offline transaction; True if it was accepted"""
+        if result.get("status") == "success":
+            # Update the transaction with server response if needed
+            if "server_approval_code" in result:
+                transaction.approval_code = result["server_approval_code"]
+            
+            logger.info(f"Offline transaction {transaction.transaction_id} successfully synced")
+            return True
+        else:
+            logger.warning(f"Server rejected offline transaction: {result.get('message', 'Unknown error')}")
+            return False
+    
     def process_transaction(self, transaction: Transaction) -> Transaction:
         """
         Process a transaction either online or offline based on current connectivity
@@ -192,7 +414,6 @@ class TransactionProcessor:
         logger.info(f"Processing transaction {transaction.transaction_id}")
         
         # Check if this transaction type can be processed offline
-        from black_rock.config.settings import PROTOCOLS
         protocol_info = PROTOCOLS[transaction.protocol]
         can_process_offline = not protocol_info["is_onledger"]
         
@@ -211,44 +432,44 @@ class TransactionProcessor:
                     self._process_offline(transaction)
                 else:
                     logger.warning(f"Transaction {transaction.transaction_id} requires online processing but terminal is offline")
-                    transaction.update_status(
+                    transaction.set_response(
                         TransactionStatus.ERROR,
                         response_code="E1001",
                         response_message="Transaction requires online processing but terminal is offline"
                     )
-        except Exception as e:
-            logger.error(f"Error processing transaction: {str(e)}")
-            transaction.update_status(
+        except Exception:
+            logger.exception("Error processing transaction %s", transaction.transaction_id)
+            transaction.set_response(
                 TransactionStatus.ERROR,
                 response_code="E9999",
-                response_message=f"Internal error: {str(e)}"
+                response_message="Internal error"
             )
         finally:
             self.status = ProcessorStatus.IDLE if self.is_online else ProcessorStatus.OFFLINE
             
             # Add to transaction history
-            self.transaction_history.append(transaction)
+            self._record_history(transaction)
             
             return transaction
     
+    def _record_history(self, transaction: Transaction) -> None:
+        """Append a transaction to the history, keeping the id index in step"""
+        with self._history_lock:
+            history = self.transaction_history
+            if len(history) == history.maxlen:
+                evicted = history[0]
+                if self._history_index.get(evicted.transaction_id) is evicted:
+                    del self._history_index[evicted.transaction_id]
+            history.append(transaction)
+            self._history_index[transaction.transaction_id] = transaction
+    
     def _process_online(self, transaction: Transaction) -> None:
         """Process a transaction online by communicating with the payment server"""
-        # Set appropriate MTI based on transaction type
-        if transaction.transaction_type == TransactionType.SALE:
-            transaction.set_mti("0200")  # Financial Transaction Request
-        elif transaction.transaction_type == TransactionType.REFUND:
-            transaction.set_mti("0200")  # Financial Transaction Request (with refund indicator)
-        elif transaction.transaction_type == TransactionType.VOID:
-            transaction.set_mti("0200")  # Financial Transaction Request (with void indicator)
-        elif transaction.transaction_type == TransactionType.PRE_AUTH:
-            transaction.set_mti("0100")  # Authorization Request
-        elif transaction.transaction_type == TransactionType.PRE_AUTH_COMPLETION:
-            transaction.set_mti("0220")  # Financial Transaction Advice
-        elif transaction.transaction_type == TransactionType.BALANCE_INQUIRY:
-            transaction.set_mti("0100")  # Authorization Request (with balance inquiry indicator)
+        # Set appropriate MTI based on transaction type (one table lookup)
+        transaction.set_mti(MTIHandler.get_mti_for_transaction_type(transaction.transaction_type))
         
         # Update transaction status
-        transaction.update_status(TransactionStatus.PROCESSING)
+        transaction.set_status(TransactionStatus.PROCESSING)
         
         # Prepare the request payload
         payload = {
@@ -256,8 +477,10 @@ class TransactionProcessor:
             "transaction": transaction.to_dict(),
             "terminal_id": self.terminal_id,
             "merchant_id": self.merchant_id,
-            "timestamp": datetime.datetime.now().isoformat()
+            "timestamp": self._now_iso()
         }
+        # Encoded once; every retry sends the same bytes
+        body = orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
         
         # Send the request to the server
         retry_count = 0
@@ -265,14 +488,16 @@ class TransactionProcessor:
         
         while retry_count <= max_retries:
             try:
-                response = requests.post(
-                    f"{self.server_url}/process",
-                    json=payload,
-                    timeout=30  # Default timeout
+                response = self.http.post(
+                    self._process_url,
+                    data=body,
+                    headers=_JSON_HEADERS,
+                    timeout=self.timeout
                 )
                 
                 if response.status_code == 200:
-                    response_data = response.json()
+                    self._mark_online()
+                    response_data = orjson.loads(response.content)
                     
                     # Process the response
                     if response_data.get("approved", False):
@@ -280,13 +505,13 @@ class TransactionProcessor:
                         if approval_code:
                             transaction.set_approval_code(approval_code)
                         else:
-                            transaction.update_status(
+                            transaction.set_response(
                                 TransactionStatus.ERROR,
                                 response_code=response_data.get("response_code", "E2001"),
                                 response_message="Missing approval code in approved transaction"
                             )
                     else:
-                        transaction.update_status(
+                        transaction.set_response(
                             TransactionStatus.DECLINED,
                             response_code=response_data.get("response_code", "D0001"),
                             response_message=response_data.get("response_message", "Transaction declined")
@@ -301,9 +526,12 @@ class TransactionProcessor:
                     
                     if retry_count <= max_retries:
                         logger.info(f"Retrying transaction {transaction.transaction_id} (attempt {retry_count}/{max_retries})")
-                        time.sleep(5)  # Default retry delay
+                        # Waiting on stop_threads lets shutdown() cut the delay short
+                        if self.stop_threads.wait(self._backoff(retry_count)):
+                            self._abort_for_shutdown(transaction)
+                            break
                     else:
-                        transaction.update_status(
+                        transaction.set_response(
                             TransactionStatus.ERROR,
                             response_code="E2002",
                             response_message=f"Server error: HTTP {response.status_code}"
@@ -315,37 +543,48 @@ class TransactionProcessor:
                 
                 if retry_count <= max_retries:
                     logger.info(f"Retrying transaction {transaction.transaction_id} (attempt {retry_count}/{max_retries})")
-                    time.sleep(5)  # Default retry delay
+                    if self.stop_threads.wait(self._backoff(retry_count)):
+                        self._abort_for_shutdown(transaction)
+                        break
                 else:
                     # If we've exhausted retries, check if we can process offline
-                    from black_rock.config.settings import PROTOCOLS
                     protocol_info = PROTOCOLS[transaction.protocol]
                     if not protocol_info["is_onledger"]:
                         logger.info(f"Falling back to offline processing for transaction {transaction.transaction_id}")
                         self._process_offline(transaction)
                     else:
-                        transaction.update_status(
+                        transaction.set_response(
                             TransactionStatus.ERROR,
                             response_code="E2003",
-                            response_message=f"Connection error: {str(e)}"
+                            response_message="Connection error"
                         )
                         self._handle_offline_mode()
                         
-            except Exception as e:
-                logger.error(f"Unexpected error in online processing: {str(e)}")
-                transaction.update_status(
+            except Exception:
+                logger.exception("Unexpected error in online processing of %s", transaction.transaction_id)
+                transaction.set_response(
                     TransactionStatus.ERROR,
                     response_code="E9999",
-                    response_message=f"Internal error: {str(e)}"
+                    response_message="Internal error"
                 )
                 break
     
+    @staticmethod
+    def _abort_for_shutdown(transaction: Transaction) -> None:
+        """Fail a transaction whose retries were cut short by shutdown()"""
+        logger.warning("Shutdown interrupted retries for transaction %s", transaction.transaction_id)
+        transaction.set_response(
+            TransactionStatus.ERROR,
+            response_code="E2004",
+            response_message="Terminal shutting down"
+        )
+    
     def _process_offline(self, transaction: Transaction) -> None:
         """Process a transaction offline"""
         # Check if transaction amount exceeds offline limit
         offline_limit = 1000.00  # Default offline limit
         if transaction.amount > offline_limit:
-            transaction.update_status(
+            transaction.set_response(
                 TransactionStatus.DECLINED,
                 response_code="D2001",
                 response_message=f"Transaction amount exceeds offline limit of {offline_limit} {transaction.currency}"
@@ -357,10 +596,11 @@ class TransactionProcessor:
         offline_code = handler.generate_approval_code(is_offline=True)
         
         transaction.set_approval_code(offline_code)
-        transaction.update_status(TransactionStatus.OFFLINE_APPROVED)
+        transaction.set_status(TransactionStatus.OFFLINE_APPROVED)
         
         # Queue for later synchronization
         self.offline_queue.put(transaction)
+        self._offline_wakeup.set()
         logger.info(f"Transaction {transaction.transaction_id} approved offline with code {offline_code}")
         
         # Make sure offline sync thread is running
@@ -373,11 +613,7 @@ class TransactionProcessor:
         Returns the void transaction if successful, None otherwise
         """
         # Find the original transaction
-        original_transaction = None
-        for transaction in self.transaction_history:
-            if transaction.transaction_id == original_transaction_id:
-                original_transaction = transaction
-                break
+        original_transaction = self._history_index.get(original_transaction_id)
         
         if not original_transaction:
             logger.warning(f"Cannot void: transaction {original_transaction_id} not found")
@@ -406,9 +642,22 @@ class TransactionProcessor:
         # Process the void
         return self.process_transaction(void_transaction)
     
+    def iter_transaction_history(self) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the in-memory transaction history as dictionaries, oldest first
+        
+        The history is snapshotted up front, so transactions processed while
+        streaming are not yielded, and each dict is built only when reached.
+        """
+        with self._history_lock:
+            history = list(self.transaction_history)
+        
+        for transaction in history:
+            yield transaction.to_dict()
+    
     def get_transaction_history(self) -> List[Dict[str, Any]]:
         """Get transaction history as a list of dictionaries"""
-        return [transaction.to_dict() for transaction in self.transaction_history]
+        return list(self.iter_transaction_history())
     
     def get_offline_queue_size(self) -> int:
         """Get the number of transactions in the offline queue"""
@@ -418,6 +667,7 @@ class TransactionProcessor:
         """Shutdown the processor and stop all threads"""
         logger.info("Shutting down transaction processor")
         self.stop_threads.set()
+        self._offline_wakeup.set()
         
         if self.heartbeat_thread:
             self.heartbeat_thread.join(timeout=2.0)
@@ -425,6 +675,15 @@ class TransactionProcessor:
         if self.offline_sync_thread:
             self.offline_sync_thread.join(timeout=2.0)
         
+        if self._sync_pool is not None:
+            self._sync_pool.shutdown(wait=False, cancel_futures=True)
+            # A restarted sync thread creates a fresh pool
+            self._sync_pool = None
+        
+        if self._owns_http:
+            self.http.close()
+        self._heartbeat_http.close()
+        
         logger.info("Transaction processor shutdown complete")
     
     def get_terminal_status(self) -> Dict[str, Any]:
@@ -440,5 +699,5 @@ class TransactionProcessor:
             "online_status": "ONLINE" if self.is_online else "OFFLINE",
             "processor_status": self.status.value,
             "offline_queue_size": self.get_offline_queue_size(),
-            "timestamp": datetime.datetime.now().isoformat()
+            "timestamp": self._now_iso()
         }
@@ -0,0 +1,193 @@
+"""
+Test script to verify API behaviour in-process through the Flask test client
+"""
+
+import os
+import tempfile
+import time
+
+from black_rock.core.tokens import token_hex
+
+_app_module = None
+
+
+def _app():
+    """Import the API app against a fresh database in a temporary directory"""
+    global _app_module
+    if _app_module is None:
+        os.environ.setdefault('SECRET_KEY', token_hex(32))
+        # Nothing listens here, so the processor stays offline
+        os.environ.setdefault('PAYMENT_SERVER_URL', 'http://127.0.0.1:9')
+        cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp())
+        try:
+            from black_rock.api import app as app_module
+        finally:
+            os.chdir(cwd)
+        _app_module = app_module
+    return _app_module
+
+
+def _logged_in_client():
+    """Register a new merchant and return (test client, merchant_id)"""
+    client = _app().app.test_client()
+    email = f"{token_hex(6)}@example.com"
+    response = client.post('/api/register', json={
+        'merchant_name': 'Test Merchant', 'email': email, 'password': 'testpassword123'
+    })
+    assert response.status_code == 201, response.json
+    response = client.post('/api/login', json={'email': email, 'password': 'testpassword123'})
+    assert response.status_code == 200, response.json
+    return client, response.json['merchant_id']
+
+
+def _transaction(merchant_id, timestamp):
+    """Stored transaction record for a merchant at the given timestamp"""
+    return {
+        'transaction_id': token_hex(8),
+        'timestamp': timestamp,
+        'amount': 10.0,
+        'currency': 'USD',
+        'transaction_type': 'SALE',
+        'payment_method': 'CARD_DIP',
+        'protocol': 'POS Terminal -201.3 (6-digit approval)',
+        'merchant_id': merchant_id,
+        'terminal_id': 'test_terminal',
+        'is_online': False,
+        'status': 'OFFLINE_APPROVED',
+        'approval_code': '123456',
+        'response_code': None,
+        'response_message': None,
+        'mti': '0200',
+        'trace_number': '000001',
+        'batch_number': '001'
+    }
+
+
+def test_history_cursor_pagination():
+    """Test that history pages follow next_cursor newest first without gaps or repeats"""
+    print("Testing transaction history pagination...")
+    client, merchant_id = _logged_in_client()
+    db_manager = _app().db_manager
+
+    # Three share a timestamp, so the order falls back to transaction_id
+    timestamps = ['2024-01-01T10:00:00', '2024-01-02T10:00:00', '2024-01-02T10:00:00',
+                  '2024-01-02T10:00:00', '2024-01-03T10:00:00']
+    transactions = [_transaction(merchant_id, timestamp) for timestamp in timestamps]
+    assert db_manager.save_transactions(transactions) == len(transactions)
+    _, other_merchant_id = _logged_in_client()
+    assert db_manager.save_transaction(_transaction(other_merchant_id, '2024-01-02T12:00:00'))
+    expected = [t['transaction_id'] for t in
+                sorted(transactions, key=lambda t: (t['timestamp'], t['transaction_id']), reverse=True)]
+
+    seen = []
+    pages = 0
+    url = '/api/transaction/history?limit=2'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200, response.data
+        page = response.json
+        assert len(page['transactions']) <= 2
+        seen += [t['transaction_id'] for t in page['transactions']]
+        pages += 1
+        url = f"/api/transaction/history?limit=2&cursor={page['next_cursor']}" if page['next_cursor'] else None
+
+    print(f"Read {len(seen)} transactions in {pages} pages")
+    assert seen == expected
+    assert pages == 3
+
+    # Out-of-range limits are clamped to at least one transaction
+    response = client.get('/api/transaction/history?limit=0')
+    assert [t['transaction_id'] for t in response.json['transactions']] == expected[:1]
+    print()
+
+
+def test_processed_transaction_in_history():
+    """Test that a processed transaction is in the history as soon as it is acknowledged"""
+    print("Testing transaction persistence before the response...")
+    client, _ = _logged_in_client()
+    response = client.post('/api/transaction/process', json={
+        'amount': 25.0,
+        'currency': 'USD',
+        'transaction_type': 'SALE',
+        'payment_method': 'CARD_DIP',
+        'protocol': 'POS Terminal -201.3 (6-digit approval)',
+        'is_online': False
+    })
+    assert response.status_code == 200, response.data
+    transaction_id = response.json['transaction']['transaction_id']
+
+    history = client.get('/api/transaction/history').json['transactions']
+    print(f"History holds {len(history)} transaction(s)")
+    assert [t['transaction_id'] for t in history] == [transaction_id]
+    print()
+
+
+def test_conditional_gets():
+    """Test that merchant info, payout info and protocols answer If-None-Match with 304"""
+    print("Testing conditional GETs...")
+    client, merchant_id = _logged_in_client()
+
+    for url in ('/api/merchant/info', '/api/merchant/payout', '/api/protocols'):
+        response = client.get(url)
+        assert response.status_code == 200, response.data
+        etag = response.headers['ETag']
+
+        cached = client.get(url, headers={'If-None-Match': etag})
+        print(f"{url}: {cached.status_code}")
+        assert cached.status_code == 304
+        assert cached.data == b''
+        assert cached.headers['ETag'] == etag
+        assert cached.headers['Cache-Control'] == response.headers['Cache-Control']
+
+        stale = client.get(url, headers={'If-None-Match': '"stale"'})
+        assert stale.status_code == 200 and stale.json == response.json
+
+    # Changing the merchant issues a new version, so the old tag no longer matches
+    etag = client.get('/api/merchant/payout').headers['ETag']
+    assert _app().payout_service.update_merchant_payout_info(merchant_id, bank_account='12345678')['success']
+    response = client.get('/api/merchant/payout', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['payout_info']['bank_account'] == '12345678'
+    assert response.headers['ETag'] != etag
+
+    # Merchant records are never cached by shared caches
+    assert client.get('/api/merchant/info').headers['Cache-Control'].startswith('private')
+    print()
+
+
+def test_notifications_listed_after_delivery():
+    """Test that notifications stay listed once the worker has delivered them"""
+    print("Testing notification listing...")
+    client, merchant_id = _logged_in_client()
+    app_module = _app()
+    transaction = _transaction(merchant_id, '2024-01-04T10:00:00')
+    assert app_module.db_manager.save_transaction(transaction)
+
+    assert app_module.notification_service.create_mti_notification('0200', transaction['transaction_id'], {})
+    for _ in range(50):
+        if not app_module.db_manager.get_pending_mti_notifications():
+            break
+        time.sleep(0.05)
+
+    notifications = client.get('/api/notifications').json['notifications']
+    print(f"Listed {len(notifications)} notification(s)")
+    assert [n['transaction_id'] for n in notifications] == [transaction['transaction_id']]
+    assert notifications[0]['processed']
+
+    # Other merchants don't see them
+    other_client, _ = _logged_in_client()
+    assert other_client.get('/api/notifications').json['notifications'] == []
+    print()
+
+
+if __name__ == "__main__":
+    print("In-process API Test")
+    print("=" * 19)
+
+    test_history_cursor_pagination()
+    test_processed_transaction_in_history()
+    test_conditional_gets()
+    test_notifications_listed_after_delivery()
+
+    print("In-process API tests completed.")
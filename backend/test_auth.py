@@ -0,0 +1,117 @@
+"""
+Test script to verify merchant password storage and authentication
+"""
+
+import hashlib
+import os
+import tempfile
+
+from black_rock.models.database import DatabaseManager
+from black_rock.services.auth_service import AuthService
+
+
+def _merchant(merchant_id, email, password_hash):
+    """Merchant row with the given stored password hash"""
+    return {
+        'merchant_id': merchant_id,
+        'merchant_name': 'Test Merchant',
+        'email': email,
+        'password_hash': password_hash,
+        'bank_account': None,
+        'crypto_wallet': None
+    }
+
+
+def _stored_hash_type(db_manager, merchant_id):
+    """SQLite storage class and length of a merchant's password hash"""
+    with db_manager._conn() as conn:
+        return tuple(conn.execute(
+            'SELECT typeof(password_hash), length(password_hash) FROM merchants WHERE merchant_id = ?',
+            (merchant_id,)
+        ).fetchone())
+
+
+def test_register_stores_blob():
+    """Test that new merchants get a salt + scrypt digest BLOB that authenticates"""
+    print("Testing scrypt BLOB password hashes...")
+    db_manager = DatabaseManager(":memory:")
+    auth_service = AuthService(db_manager)
+
+    result = auth_service.register_merchant("Test Merchant", "blob@example.com", "testpassword123")
+    assert result['success'], result
+
+    stored = _stored_hash_type(db_manager, result['merchant_id'])
+    print(f"Stored hash: {stored}")
+    assert stored == ('blob', 48)
+
+    assert auth_service.authenticate_merchant("blob@example.com", "testpassword123")['success']
+    assert not auth_service.authenticate_merchant("blob@example.com", "wrongpassword")['success']
+    assert not auth_service.authenticate_merchant("missing@example.com", "testpassword123")['success']
+    db_manager.close()
+    print()
+
+
+def test_legacy_sha256_login():
+    """Test that legacy SHA-256 text hashes log in and are upgraded to scrypt"""
+    print("Testing legacy SHA-256 password hashes...")
+    db_manager = DatabaseManager(":memory:")
+    auth_service = AuthService(db_manager)
+
+    salt = os.urandom(16).hex()
+    legacy_hash = hashlib.sha256(("testpassword123" + salt).encode()).hexdigest() + ":" + salt
+    assert db_manager.add_merchant(_merchant("legacy_merchant", "legacy@example.com", legacy_hash))
+    assert _stored_hash_type(db_manager, "legacy_merchant")[0] == 'text'
+
+    # A failed login leaves the legacy hash alone
+    assert not auth_service.authenticate_merchant("legacy@example.com", "wrongpassword")['success']
+    assert _stored_hash_type(db_manager, "legacy_merchant")[0] == 'text'
+
+    result = auth_service.authenticate_merchant("legacy@example.com", "testpassword123")
+    print(f"Legacy login: {result['message']}")
+    assert result['success'] and result['merchant_id'] == "legacy_merchant"
+
+    # The successful login rehashed the password with scrypt
+    stored = _stored_hash_type(db_manager, "legacy_merchant")
+    print(f"Upgraded hash: {stored}")
+    assert stored == ('blob', 48)
+    assert auth_service.authenticate_merchant("legacy@example.com", "testpassword123")['success']
+    assert not auth_service.authenticate_merchant("legacy@example.com", "wrongpassword")['success']
+
+    # A hash in neither format is refused rather than raising
+    assert db_manager.add_merchant(_merchant("broken_merchant", "broken@example.com", "not-a-hash"))
+    assert not auth_service.authenticate_merchant("broken@example.com", "testpassword123")['success']
+    db_manager.close()
+    print()
+
+
+def test_scrypt_text_migration():
+    """Test that scrypt hashes saved as text are rewritten to BLOBs on startup"""
+    print("Testing scrypt text hash migration...")
+    db_path = os.path.join(tempfile.mkdtemp(), "payment_terminal.db")
+    db_manager = DatabaseManager(db_path)
+    auth_service = AuthService(db_manager)
+
+    digest, salt = auth_service.hash_password("testpassword123")
+    text_hash = f"scrypt${digest.hex()}:{salt.hex()}"
+    assert db_manager.add_merchant(_merchant("scrypt_merchant", "scrypt@example.com", text_hash))
+    db_manager.close()
+
+    db_manager = DatabaseManager(db_path)
+    auth_service = AuthService(db_manager)
+    stored = _stored_hash_type(db_manager, "scrypt_merchant")
+    print(f"Migrated hash: {stored}")
+    assert stored == ('blob', 48)
+    assert auth_service.authenticate_merchant("scrypt@example.com", "testpassword123")['success']
+    db_manager.close()
+    print()
+
+
+if __name__ == "__main__":
+    print("Authentication Test")
+    print("=" * 19)
+
+    test_register_stores_blob()
+    test_legacy_sha256_login()
+    test_scrypt_text_migration()
+
+    print("Authentication tests completed.")
@@ -8,7 +8,7 @@ import os
 # Add src to path so we can import our modules
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from black_rock.core.transaction import Transaction, TransactionType, PaymentMethod
+from black_rock.core.transaction import Transaction, TransactionType, TransactionStatus, PaymentMethod
 from black_rock.handlers.protocol_handler import ProtocolFactory, MTIHandler
 from black_rock.services.transaction_processor import TransactionProcessor
 
@@ -70,6 +70,51 @@ def test_mti_handler():
     print(f"MTI {valid_mti} description: {MTIHandler.get_mti_description(valid_mti)}")
     print()
 
+def test_to_dict_tracks_changes():
+    """Test that to_dict reflects every change made after it was first called"""
+    print("Testing to_dict after changes...")
+    
+    transaction = Transaction(
+        amount=25.00,
+        currency="USD",
+        transaction_type=TransactionType.SALE,
+        payment_method=PaymentMethod.CARD_DIP,
+        protocol="POS Terminal -101.1 (4-digit approval)",
+        merchant_id="test_merchant_123",
+        terminal_id="test_terminal_456"
+    )
+    assert transaction.to_dict()["status"] == "INITIALIZED"
+    
+    # Changes through the setters
+    transaction.set_mti("0200")
+    transaction.set_status(TransactionStatus.PROCESSING)
+    assert transaction.to_dict()["mti"] == "0200"
+    assert transaction.to_dict()["status"] == "PROCESSING"
+    transaction.set_approval_code("1234")
+    assert transaction.to_dict()["approval_code"] == "1234"
+    assert transaction.to_dict()["status"] == "APPROVED"
+    transaction.set_response(TransactionStatus.DECLINED, "D0001", "Declined")
+    data = transaction.to_dict()
+    assert (data["status"], data["response_code"], data["response_message"]) == \
+        ("DECLINED", "D0001", "Declined")
+    transaction.update_status(TransactionStatus.ERROR, response_code="E0001")
+    assert transaction.to_dict()["response_code"] == "E0001"
+    
+    # Direct assignment, as the offline sync path does with server approval codes
+    transaction.approval_code = "5678"
+    assert transaction.to_dict()["approval_code"] == "5678"
+    
+    # The returned dictionary is a copy
+    data = transaction.to_dict()
+    data["status"] = "CANCELLED"
+    assert transaction.to_dict()["status"] == "ERROR"
+    
+    # A round trip through from_dict keeps every field
+    assert Transaction.from_dict(transaction.to_dict()).to_dict() == transaction.to_dict()
+    
+    print(f"Final state: {transaction.to_dict()['status']} {transaction.to_dict()['approval_code']}")
+    print()
+
 if __name__ == "__main__":
     print("Payment Terminal Transaction Test")
     print("=" * 35)
@@ -83,4 +128,7 @@ if __name__ == "__main__":
     # Test MTI handler
     test_mti_handler()
     
+    # Test to_dict after changes
+    test_to_dict_tracks_changes()
+    
     print("Transaction tests completed.")
\ No newline at end of file
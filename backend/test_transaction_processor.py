@@ -0,0 +1,234 @@
+"""
+Test script to verify transaction processor server communication
+"""
+
+import socket
+import threading
+import time
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from black_rock.core.transaction import Transaction, TransactionType, PaymentMethod
+from black_rock.services import transaction_processor
+from black_rock.services.transaction_processor import TransactionProcessor, HEARTBEAT_TIMEOUT
+
+OFFLINE_PROTOCOL = "POS Terminal -201.3 (6-digit approval)"
+
+
+class _SilentServer:
+    """Accepts connections and never answers, like a hung payment server"""
+
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.url = f"http://127.0.0.1:{self.sock.getsockname()[1]}"
+        self.connections = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections.append(conn)
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+        self.sock.close()
+
+
+def _make_processor(server_url, http=None, **kwargs):
+    """Create a processor without its background heartbeat thread"""
+    start_heartbeat = TransactionProcessor._start_heartbeat_thread
+    TransactionProcessor._start_heartbeat_thread = lambda self: None
+    try:
+        return TransactionProcessor("test_merchant", "test_terminal", server_url, http=http, **kwargs)
+    finally:
+        TransactionProcessor._start_heartbeat_thread = start_heartbeat
+
+
+def _response(status_code, content):
+    """Build a payment server response"""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    return response
+
+
+def _offline_transaction(processor):
+    """Process a small offline sale and return it"""
+    transaction = Transaction(
+        amount=10.0,
+        currency="USD",
+        transaction_type=TransactionType.SALE,
+        payment_method=PaymentMethod.CARD_DIP,
+        protocol=OFFLINE_PROTOCOL,
+        merchant_id="test_merchant",
+        terminal_id="test_terminal",
+        is_online=False
+    )
+    return processor.process_transaction(transaction)
+
+
+def test_heartbeat_dead_server():
+    """A hung server marks the terminal offline after one short heartbeat timeout"""
+    print("Testing heartbeat against a dead server...")
+    server = _SilentServer()
+
+    # A shared session that retries must not stretch the heartbeat
+    http = requests.Session()
+    http.mount("http://", HTTPAdapter(max_retries=Retry(total=3, read=3, allowed_methods=None)))
+    processor = _make_processor(server.url, http=http)
+    try:
+        started = time.monotonic()
+        processor._send_heartbeat()
+        elapsed = time.monotonic() - started
+    finally:
+        processor.shutdown()
+        http.close()
+        server.close()
+
+    print(f"Heartbeat gave up after {elapsed:.1f}s over {len(server.connections)} connection(s)")
+    assert not processor.is_online
+    assert len(server.connections) == 1
+    assert elapsed < sum(HEARTBEAT_TIMEOUT) + 1
+    print()
+
+
+def test_retries_stop_on_shutdown():
+    """Shutdown ends the online retry loop instead of sending the retries back to back"""
+    print("Testing online retries during shutdown...")
+    processor = _make_processor("http://127.0.0.1:9")
+    processor.is_online = True
+    requests_sent = []
+
+    def post(url, **kwargs):
+        requests_sent.append(url)
+        return _response(500, b"{}")
+
+    processor.http.post = post
+    processor.shutdown()
+    transaction = Transaction(
+        amount=10.0,
+        currency="USD",
+        transaction_type=TransactionType.SALE,
+        payment_method=PaymentMethod.CARD_DIP,
+        protocol=OFFLINE_PROTOCOL,
+        merchant_id="test_merchant",
+        terminal_id="test_terminal",
+        is_online=True
+    )
+    processor.process_transaction(transaction)
+
+    print(f"Sent {len(requests_sent)} request(s) after shutdown")
+    assert len(requests_sent) == 1
+    assert transaction.to_dict()["response_code"] == "E2004"
+    print()
+
+
+def test_history_snapshot():
+    """History keeps only the newest transactions and streams a snapshot"""
+    print("Testing bounded transaction history...")
+    history_max = transaction_processor.TRANSACTION_HISTORY_MAX
+    transaction_processor.TRANSACTION_HISTORY_MAX = 3
+    try:
+        processor = _make_processor("http://127.0.0.1:9")
+    finally:
+        transaction_processor.TRANSACTION_HISTORY_MAX = history_max
+    processor.is_online = False
+    try:
+        ids = [_offline_transaction(processor).transaction_id for _ in range(6)]
+
+        history = processor.iter_transaction_history()
+        streamed = [next(history)["transaction_id"]]
+        # Transactions processed while streaming are not part of the snapshot
+        for _ in range(2):
+            _offline_transaction(processor)
+        assert len(processor.get_transaction_history()) == 3
+        streamed += [entry["transaction_id"] for entry in history]
+    finally:
+        processor.shutdown()
+
+    print(f"Streamed {len(streamed)} transactions")
+    assert streamed == ids[-3:]
+    print()
+
+
+def test_offline_sync_after_restart():
+    """The offline sync pool is recreated when sync restarts after shutdown"""
+    print("Testing offline sync after a restart...")
+    processor = _make_processor("http://127.0.0.1:9")
+    processor.is_online = False
+    for _ in range(3):
+        _offline_transaction(processor)
+    processor._start_offline_sync_thread()
+    processor.shutdown()
+    assert processor._sync_pool is None
+
+    # A server without the bulk endpoint that accepts every single sync
+    processor.http.post = lambda url, **kwargs: (
+        _response(404, b"{}") if url.endswith("_batch") else _response(200, b'{"status": "success"}')
+    )
+    processor.stop_threads.clear()
+    processor._start_offline_sync_thread()
+    try:
+        synced = processor._sync_offline_batch()
+    finally:
+        processor.shutdown()
+
+    print(f"Synced {synced} offline transactions")
+    assert synced == 3
+    assert processor.get_offline_queue_size() == 0
+    print()
+
+
+def test_offline_sync_bulk():
+    """Queued offline transactions sync in one bulk request; unanswered ones are requeued"""
+    print("Testing bulk offline sync...")
+    processor = _make_processor("http://127.0.0.1:9")
+    processor.is_online = False
+    transactions = [_offline_transaction(processor) for _ in range(3)]
+
+    requests_sent = []
+
+    def post(url, data=None, **kwargs):
+        requests_sent.append(url)
+        results = [
+            {"transaction_id": transaction.transaction_id, "status": "success",
+             "server_approval_code": "654321"}
+            for transaction in transactions[:2]
+        ]
+        return _response(200, orjson.dumps({"results": results}))
+
+    processor.http.post = post
+    processor._start_offline_sync_thread()
+    try:
+        synced = processor._sync_offline_batch()
+    finally:
+        processor.shutdown()
+
+    print(f"Synced {synced} offline transactions in {len(requests_sent)} request(s)")
+    assert requests_sent == ["http://127.0.0.1:9/sync_offline_batch"]
+    assert synced == 2
+    assert processor.get_offline_queue_size() == 1
+    assert transactions[0].to_dict()["approval_code"] == "654321"
+    print()
+
+
+if __name__ == "__main__":
+    print("Transaction Processor Test")
+    print("=" * 26)
+
+    test_heartbeat_dead_server()
+    test_retries_stop_on_shutdown()
+    test_history_snapshot()
+    test_offline_sync_after_restart()
+    test_offline_sync_bulk()
+
+    print("Transaction processor tests completed.")